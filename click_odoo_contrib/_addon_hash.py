@@ -1,28 +1,105 @@
 # Copyright 2018 ACSONE SA/NV.
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import ast
+import csv
 import hashlib
+import io
+import json
 import os
-from fnmatch import fnmatch
+import re
+import threading
+import time
+from fnmatch import translate
+from functools import lru_cache, partial
+from xml.etree import ElementTree
 
+from ._cache import read_json, write_json
 
-def _fnmatch(filename, patterns):
-    for pattern in patterns:
-        if fnmatch(filename, pattern):
-            return True
-    return False
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+DEFAULT_ALGORITHM = "sha1"
+# hash algorithms for addon digests, all digests are at most 160 bits
+ALGORITHMS = {
+    "sha1": hashlib.sha1,
+    "blake2b": partial(hashlib.blake2b, digest_size=20),
+}
+if xxhash is not None:
+    # fast non cryptographic hash, when xxhash is installed
+    ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+
+# bump this when the way digests or fingerprints are computed changes
+CACHE_VERSION = 5
+# keep digests for at most this many (exclude_patterns, keep_langs) combinations
+# per addon, so click-odoo-update and click-odoo-initdb can share a cache file
+CACHE_MAX_PARAMS_PER_ADDON = 4
+# files modified less than this many nanoseconds before hashing may be
+# modified again without their mtime changing, so they are not cached
+RACY_NS = 2 * 10**9
+# files are hashed by chunks of this size, so memory does not grow with file size
+BUFFER_SIZE = 256 * 1024
+# semantic digests read files whole to normalize them, so larger files
+# are hashed as is, by chunks
+NORMALIZE_MAX_SIZE = 16 * 1024 * 1024
+
+
+class ExcludePatterns:
+    """Compiled fnmatch exclude patterns.
+
+    Besides matching file paths, it tells if all files below a directory
+    are excluded, so the walk does not need to list them.
+    """
+
+    def __init__(self, patterns):
+        patterns = [os.path.normcase(p) for p in patterns]
+        self._file_re = self._compile(patterns)
+        # if dir/ matches the pattern without its trailing *, that *
+        # matches anything below dir, including subdirectories
+        self._dir_re = self._compile([p[:-1] for p in patterns if p.endswith("*")])
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile("|".join(translate(p) for p in patterns))
+
+    def match(self, filepath):
+        return bool(self._file_re and self._file_re.match(os.path.normcase(filepath)))
+
+    def match_dir(self, dirpath):
+        if not self._dir_re:
+            return False
+        prefix = ""
+        for part in os.path.normcase(dirpath).split(os.sep):
+            prefix = prefix + part + os.sep
+            if self._dir_re.match(prefix):
+                return True
+        return False
+
+
+@lru_cache()
+def compile_exclude_patterns(exclude_patterns):
+    return ExcludePatterns(exclude_patterns)
 
 
 def _walk(top, exclude_patterns, keep_langs):
+    exclude_patterns = compile_exclude_patterns(tuple(exclude_patterns))
     keep_langs = {lang.split("_")[0] for lang in keep_langs}
     for dirpath, dirnames, filenames in os.walk(top):
-        dirnames.sort()
         reldir = os.path.relpath(dirpath, top)
         if reldir == ".":
             reldir = ""
+        dirnames[:] = [
+            dirname
+            for dirname in sorted(dirnames)
+            if not exclude_patterns.match_dir(os.path.join(reldir, dirname))
+        ]
         for filename in sorted(filenames):
             filepath = os.path.join(reldir, filename)
-            if _fnmatch(filepath, exclude_patterns):
+            if exclude_patterns.match(filepath):
                 continue
             if keep_langs and reldir in {"i18n", "i18n_extra"}:
                 basename, ext = os.path.splitext(filename)
@@ -32,13 +109,397 @@ def _walk(top, exclude_patterns, keep_langs):
             yield filepath
 
 
-def addon_hash(top, exclude_patterns, keep_langs):
-    """Compute a sha1 digest of file contents."""
+def _params_key(exclude_patterns, keep_langs, algorithm, semantic=False):
+    keep_langs = sorted({lang.split("_")[0] for lang in keep_langs})
+    params = [CACHE_VERSION, list(exclude_patterns), keep_langs, algorithm]
+    if semantic:
+        params.append("semantic")
+    return hashlib.sha1(json.dumps(params).encode("utf-8")).hexdigest()
+
+
+def _fingerprint(top, filepaths):
+    """Compute a digest of the name, size, mtime, ctime and inode of files.
+
+    The ctime catches changes that keep the size and restore the mtime
+    (cp -p, touch -r, rsync -t, tar extraction), as it cannot be set.
+    Return (fingerprint, {directory: fingerprint of its files}, newest
+    mtime in nanoseconds).
+    """
     m = hashlib.sha1()
-    for filepath in _walk(top, exclude_patterns, keep_langs):
+    dir_ms = {}
+    newest_mtime_ns = 0
+    for filepath in filepaths:
+        st = os.stat(os.path.join(top, filepath))
+        line = "{}\0{}\0{}\0{}\0{}\n".format(
+            filepath, st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino
+        ).encode("utf-8")
+        m.update(line)
+        dirpath = os.path.dirname(filepath)
+        dir_m = dir_ms.get(dirpath)
+        if dir_m is None:
+            dir_m = dir_ms[dirpath] = hashlib.sha1()
+        dir_m.update(line)
+        newest_mtime_ns = max(newest_mtime_ns, st.st_mtime_ns)
+    dir_fingerprints = {dirpath: dir_m.hexdigest() for dirpath, dir_m in dir_ms.items()}
+    return m.hexdigest(), dir_fingerprints, newest_mtime_ns
+
+
+class HashCache:
+    """Persistent cache of addon digests, validated by file stat.
+
+    One cache file is kept per addons directory. For each addon it stores
+    the digest computed for a given set of exclude patterns and languages,
+    along with a fingerprint of the name, size, mtime, ctime and inode of
+    the hashed files. An addon whose fingerprint did not change is not
+    read again. When the file tree was requested, it is stored too, with
+    a fingerprint of the files of each directory, so the digests of files
+    in unchanged directories are reused when the addon changes.
+
+    When cache_dir is None, digests are only cached in memory.
+    The cache can be shared by threads hashing different addons.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._addons_dirs = {}  # addons_dir -> cache file content
+        self._dirty = set()  # addons dirs with modified content
+
+    def _cache_path(self, addons_dir):
+        h = hashlib.sha1(addons_dir.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "addon-hashes-{}.json".format(h))
+
+    def _addons_dir_data(self, addons_dir):
+        data = self._addons_dirs.get(addons_dir)
+        if data is None:
+            if self.cache_dir:
+                data = read_json(self._cache_path(addons_dir))
+            if (
+                not isinstance(data, dict)
+                or data.get("version") != CACHE_VERSION
+                or data.get("addons_dir") != addons_dir
+            ):
+                data = {
+                    "version": CACHE_VERSION,
+                    "addons_dir": addons_dir,
+                    "addons": {},
+                }
+            self._addons_dirs[addons_dir] = data
+        return data
+
+    @staticmethod
+    def _split(top):
+        top = os.path.realpath(top)
+        return os.path.dirname(top), os.path.basename(top)
+
+    def get(self, top, params_key):
+        """Return the [fingerprint, digest, tree, directory fingerprints]
+        cached for an addon, or None."""
+        addons_dir, addon_name = self._split(top)
+        with self._lock:
+            data = self._addons_dir_data(addons_dir)
+            return data["addons"].get(addon_name, {}).get(params_key)
+
+    def set(self, top, params_key, fingerprint, digest, tree, dir_fingerprints):
+        addons_dir, addon_name = self._split(top)
+        with self._lock:
+            data = self._addons_dir_data(addons_dir)
+            entries = data["addons"].setdefault(addon_name, {})
+            entries.pop(params_key, None)
+            entries[params_key] = [fingerprint, digest, tree, dir_fingerprints]
+            while len(entries) > CACHE_MAX_PARAMS_PER_ADDON:
+                # dicts are ordered, drop the least recently set entry
+                entries.pop(next(iter(entries)))
+            self._dirty.add(addons_dir)
+
+    def save(self):
+        if not self.cache_dir:
+            return
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        for addons_dir in sorted(self._dirty):
+            data = self._addons_dirs[addons_dir]
+            # forget addons that have been removed
+            data["addons"] = {
+                addon_name: entries
+                for addon_name, entries in data["addons"].items()
+                if os.path.isdir(os.path.join(addons_dir, addon_name))
+            }
+            write_json(self._cache_path(addons_dir), data)
+        self._dirty.clear()
+
+
+# read buffer of each hashing thread, so it is not allocated for each file
+_buffers = threading.local()
+
+
+def hash_file(path, *hash_objects):
+    """Update hash objects with the content of a file, read by chunks."""
+    view = getattr(_buffers, "view", None)
+    if view is None:
+        view = _buffers.view = memoryview(bytearray(BUFFER_SIZE))
+    # chunks are read directly in the buffer, without python buffering
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(view)
+            if not size:
+                break
+            for hash_object in hash_objects:
+                hash_object.update(view[:size])
+
+
+def _normalize_py(content):
+    # the ast of a module ignores comments and formatting; note that its
+    # dump may differ between python versions
+    return ast.dump(ast.parse(content)).encode("utf-8")
+
+
+def _normalize_manifest(content):
+    manifest = ast.literal_eval(content.decode("utf-8"))
+    return json.dumps(manifest, sort_keys=True).encode("utf-8")
+
+
+def _canonical_xml(element, lines):
+    lines.append(
+        json.dumps(
+            [
+                element.tag,
+                sorted(element.attrib.items()),
+                (element.text or "").strip(),
+                (element.tail or "").strip(),
+                len(element),
+            ]
+        )
+    )
+    for child in element:
+        _canonical_xml(child, lines)
+
+
+def _normalize_xml(content):
+    # comments, attribute order and whitespace around texts are ignored
+    lines = []
+    _canonical_xml(ElementTree.fromstring(content), lines)
+    return "\n".join(lines).encode("utf-8")
+
+
+def _normalize_csv(content):
+    # quoting and line endings are ignored
+    rows = csv.reader(io.StringIO(content.decode("utf-8"), newline=""))
+    return "\n".join(json.dumps(row) for row in rows if row).encode("utf-8")
+
+
+# functions returning a normalized form of file contents, by file name
+# or extension, for semantic digests
+NORMALIZERS = {
+    "__manifest__.py": _normalize_manifest,
+    "__openerp__.py": _normalize_manifest,
+    ".py": _normalize_py,
+    ".xml": _normalize_xml,
+    ".csv": _normalize_csv,
+}
+
+
+def _normalize_file(path):
+    """Return the normalized content of a file, or None if not normalized.
+
+    Files larger than NORMALIZE_MAX_SIZE are not normalized.
+    """
+    filename = os.path.basename(path)
+    normalizer = NORMALIZERS.get(filename)
+    if normalizer is None:
+        normalizer = NORMALIZERS.get(os.path.splitext(filename)[1])
+    if normalizer is None:
+        return None
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > NORMALIZE_MAX_SIZE:
+            return None
+        content = f.read()
+    try:
+        return normalizer(content)
+    except (SyntaxError, ValueError, TypeError, ElementTree.ParseError, csv.Error):
+        # not valid, so its exact content matters
+        return content
+
+
+def _make_tree(file_digests, algorithm):
+    root = {}
+    for filepath, file_digest in file_digests:
+        parts = filepath.split(os.sep)
+        node = root
+        for dirname in parts[:-1]:
+            node = node.setdefault(dirname, {})
+        node[parts[-1]] = file_digest
+    return _seal_tree(root, ALGORITHMS[algorithm])
+
+
+def _seal_tree(entries, new_hash):
+    m = new_hash()
+    for name in sorted(entries):
+        child = entries[name]
+        if isinstance(child, dict):
+            child = entries[name] = _seal_tree(child, new_hash)
+            m.update("{}\0d\0{}\n".format(name, child[0]).encode("utf-8"))
+        else:
+            m.update("{}\0f\0{}\n".format(name, child).encode("utf-8"))
+    return [m.hexdigest(), entries]
+
+
+def _tree_digests(tree, prefix=""):
+    """Yield (filepath, digest) of the files of a tree, sorted by path."""
+    for name, child in sorted(tree[1].items()):
+        path = os.path.join(prefix, name)
+        if isinstance(child, list):
+            yield from _tree_digests(child, path)
+        else:
+            yield path, child
+
+
+def _tree_files(tree, prefix=""):
+    for path, _ in _tree_digests(tree, prefix):
+        yield path
+
+
+def diff_trees(old_tree, new_tree, prefix=""):
+    """Compare two file trees returned by addon_hash_tree.
+
+    Yield (status, filepath) tuples, where status is one of added,
+    removed or modified. Subtrees with the same digest are not visited.
+    """
+    if old_tree[0] == new_tree[0]:
+        return
+    old_entries, new_entries = old_tree[1], new_tree[1]
+    for name in sorted(set(old_entries) | set(new_entries)):
+        path = os.path.join(prefix, name)
+        old_child = old_entries.get(name)
+        new_child = new_entries.get(name)
+        if old_child == new_child:
+            continue
+        if isinstance(old_child, list) and isinstance(new_child, list):
+            yield from diff_trees(old_child, new_child, path)
+            continue
+        if isinstance(old_child, str) and isinstance(new_child, str):
+            yield "modified", path
+            continue
+        if isinstance(old_child, list):
+            for filepath in _tree_files(old_child, path):
+                yield "removed", filepath
+        elif old_child is not None:
+            yield "removed", path
+        if isinstance(new_child, list):
+            for filepath in _tree_files(new_child, path):
+                yield "added", filepath
+        elif new_child is not None:
+            yield "added", path
+
+
+def _hash_files(top, filepaths, algorithm, semantic, with_tree, reused_digests):
+    """Return (digest of files, list of (filepath, file digest) or None).
+
+    Files in reused_digests are only read for the digest of all files.
+    """
+    new_hash = ALGORITHMS[algorithm]
+    m = new_hash()
+    file_digests = [] if with_tree else None
+    for filepath in filepaths:
         # hash filename so empty files influence the hash
         m.update(filepath.encode("utf-8"))
         # hash file content
-        with open(os.path.join(top, filepath), "rb") as f:
-            m.update(f.read())
-    return m.hexdigest()
+        file_digest = file_m = None
+        if with_tree:
+            file_digest = reused_digests.get(filepath)
+            if file_digest is None:
+                file_m = new_hash()
+        hash_objects = (m,) if file_m is None else (m, file_m)
+        content = None
+        if semantic:
+            content = _normalize_file(os.path.join(top, filepath))
+        if content is not None:
+            for hash_object in hash_objects:
+                hash_object.update(content)
+        else:
+            hash_file(os.path.join(top, filepath), *hash_objects)
+        if with_tree:
+            if file_m is not None:
+                file_digest = file_m.hexdigest()
+            file_digests.append((filepath, file_digest))
+    return m.hexdigest(), file_digests
+
+
+def addon_hash_tree(
+    top,
+    exclude_patterns,
+    keep_langs,
+    cache=None,
+    algorithm=DEFAULT_ALGORITHM,
+    semantic=False,
+    with_tree=True,
+):
+    """Compute a digest of file contents, and a tree of file digests.
+
+    algorithm is one of ALGORITHMS, sha1 by default.
+
+    If semantic is True, python, xml and csv files and manifests are
+    normalized before being hashed (see NORMALIZERS), so that changes
+    of formatting or comments do not change the digest. Normalizing
+    reads files whole, so those larger than NORMALIZE_MAX_SIZE are
+    hashed as is.
+
+    The tree is a Merkle tree of the hashed files, where a directory is
+    a [digest, {name: tree or file digest}] list, and is computed while
+    reading files for the addon digest. It is json serializable. Unless
+    with_tree is set, it is not computed and None is returned instead,
+    so file contents are only hashed once.
+
+    If a HashCache is provided, files of an addon are not read when
+    their name, size, mtime, ctime and inode did not change since the
+    cached digest was computed. When some did, the file digests of
+    directories whose files did not change are taken from the cached
+    tree.
+    """
+    filepaths = list(_walk(top, exclude_patterns, keep_langs))
+    reused_digests = {}
+    if cache is not None:
+        start_ns = int(time.time() * 10**9)
+        params_key = _params_key(exclude_patterns, keep_langs, algorithm, semantic)
+        fingerprint, dir_fingerprints, newest_mtime_ns = _fingerprint(top, filepaths)
+        cached = cache.get(top, params_key)
+        if cached and (not with_tree or cached[2] is not None):
+            if cached[0] == fingerprint:
+                return cached[1], cached[2] if with_tree else None
+            if with_tree:
+                reused_digests = {
+                    filepath: file_digest
+                    for filepath, file_digest in _tree_digests(cached[2])
+                    if dir_fingerprints.get(os.path.dirname(filepath))
+                    == cached[3].get(os.path.dirname(filepath))
+                }
+    digest, file_digests = _hash_files(
+        top, filepaths, algorithm, semantic, with_tree, reused_digests
+    )
+    tree = _make_tree(file_digests, algorithm) if with_tree else None
+    if cache is not None and newest_mtime_ns < start_ns - RACY_NS:
+        cache.set(
+            top,
+            params_key,
+            fingerprint,
+            digest,
+            tree,
+            dir_fingerprints if with_tree else None,
+        )
+    return digest, tree
+
+
+def addon_hash(
+    top,
+    exclude_patterns,
+    keep_langs,
+    cache=None,
+    algorithm=DEFAULT_ALGORITHM,
+    semantic=False,
+):
+    """Compute a digest of file contents, sha1 by default."""
+    return addon_hash_tree(
+        top, exclude_patterns, keep_langs, cache, algorithm, semantic, False
+    )[0]
@@ -0,0 +1,119 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import compileall
+import importlib.util
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ._cache import default_cache_dir
+
+_logger = logging.getLogger(__name__)
+
+# files compiled by each task sent to a worker process
+CHUNK_SIZE = 64
+
+
+def _is_writable(addon_dir):
+    pycache_dir = os.path.join(addon_dir, "__pycache__")
+    if os.path.isdir(pycache_dir):
+        return os.access(pycache_dir, os.W_OK)
+    return os.access(addon_dir, os.W_OK)
+
+
+def _bytecode_mtime(filepath):
+    try:
+        return os.stat(importlib.util.cache_from_source(filepath)).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+def _init_worker(pycache_prefix):
+    # not inherited by processes that are not forked (spawn, forkserver)
+    sys.pycache_prefix = pycache_prefix
+
+
+def _compile_file(filepath):
+    """Compile a python file if its bytecode is missing or outdated.
+
+    Return the seconds spent compiling it, or None if it was up to date.
+    Syntax errors are ignored here, importing the file reports them.
+    """
+    mtime = _bytecode_mtime(filepath)
+    start = time.perf_counter()
+    compileall.compile_file(filepath, quiet=2)
+    seconds = time.perf_counter() - start
+    if _bytecode_mtime(filepath) == mtime:
+        return None
+    return seconds
+
+
+def _python_files(addon_dir, include_tests):
+    for dirpath, dirnames, filenames in os.walk(addon_dir):
+        dirnames[:] = [
+            dirname
+            for dirname in dirnames
+            if dirname != "__pycache__" and (include_tests or dirname != "tests")
+        ]
+        for filename in filenames:
+            if filename.endswith(".py"):
+                yield os.path.join(dirpath, filename)
+
+
+def precompile_addons(addon_dirs, jobs=None, include_tests=False):
+    """Compile the python files of addons to bytecode, in parallel.
+
+    Odoo imports addons one after the other while loading the registry,
+    compiling each python file whose bytecode is missing or outdated, as
+    on a freshly deployed container. Compiling them beforehand with jobs
+    processes (default: the number of CPUs) leaves only the loading of
+    bytecode to the registry load.
+
+    If some addons directories are read-only, bytecode is written in the
+    pycache directory of the click-odoo-contrib cache, by setting
+    sys.pycache_prefix in this process, so the registry load finds it, and
+    in the compiling processes; this needs Python >= 3.8, so addons are
+    not compiled with previous versions.
+    Tests are not compiled unless include_tests is set.
+
+    Return (number of files compiled, seconds spent compiling them
+    sequentially, elapsed seconds), where the seconds spent compiling
+    files approximate the time saved on the registry load.
+    """
+    start = time.perf_counter()
+    addon_dirs = sorted(set(addon_dirs))
+    if not all(_is_writable(addon_dir) for addon_dir in addon_dirs):
+        if sys.version_info < (3, 8):
+            _logger.warning(
+                "Addons are not compiled, as some addons directories are "
+                "read-only and Python < 3.8 cannot write bytecode elsewhere."
+            )
+            return 0, 0.0, time.perf_counter() - start
+        if sys.pycache_prefix is None:
+            sys.pycache_prefix = os.path.join(default_cache_dir(), "pycache")
+            _logger.info(
+                "Some addons directories are read-only, writing bytecode in %s.",
+                sys.pycache_prefix,
+            )
+    filepaths = [
+        filepath
+        for addon_dir in addon_dirs
+        for filepath in _python_files(addon_dir, include_tests)
+    ]
+    jobs = jobs or os.cpu_count()
+    if jobs > 1 and len(filepaths) > CHUNK_SIZE:
+        executor_kwargs = {}
+        if sys.version_info >= (3, 8):
+            executor_kwargs = {
+                "initializer": _init_worker,
+                "initargs": (sys.pycache_prefix,),
+            }
+        with ProcessPoolExecutor(max_workers=jobs, **executor_kwargs) as executor:
+            results = list(executor.map(_compile_file, filepaths, chunksize=CHUNK_SIZE))
+    else:
+        results = [_compile_file(filepath) for filepath in filepaths]
+    compiled = [seconds for seconds in results if seconds is not None]
+    return len(compiled), sum(compiled), time.perf_counter() - start
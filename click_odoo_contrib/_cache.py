@@ -0,0 +1,60 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import json
+import logging
+import os
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+
+def default_cache_dir():
+    """Return the directory where click-odoo-contrib keeps its caches.
+
+    It is $CLICK_ODOO_CONTRIB_CACHE_DIR if set, else click-odoo-contrib
+    in $XDG_CACHE_HOME (which defaults to ~/.cache).
+    """
+    cache_dir = os.environ.get("CLICK_ODOO_CONTRIB_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(xdg_cache_home, "click-odoo-contrib")
+
+
+def read_json(path):
+    """Read a json cache file, return None if it is missing or corrupted."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        _logger.warning("Ignoring unreadable cache file %s", path, exc_info=True)
+        return None
+
+
+def write_json(path, data):
+    """Atomically write a json cache file.
+
+    Caches are an optimization, so failing to write one (read-only
+    file system, permissions...) is logged and otherwise ignored.
+    Return True if the file was written.
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        _logger.warning("Could not write cache file %s", path, exc_info=True)
+        return False
+    return True
@@ -0,0 +1,200 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import logging
+import statistics
+
+from click_odoo import odoo
+
+from .manifest import DependencyGraph
+
+_logger = logging.getLogger(__name__)
+
+# durations of modules loaded, installed or upgraded by updates
+DURATION_TABLE = "click_odoo_module_duration"
+# durations kept for each module and action
+HISTORY_SIZE = 10
+
+
+def _duration_table_exists(cr):
+    cr.execute("SELECT to_regclass(%s) IS NOT NULL", (DURATION_TABLE,))
+    return cr.fetchone()[0]
+
+
+def _ensure_duration_table(cr):
+    if _duration_table_exists(cr):
+        return
+    cr.execute(
+        "CREATE TABLE " + DURATION_TABLE + " ("
+        "  id serial PRIMARY KEY,"
+        "  module varchar NOT NULL,"
+        "  action varchar NOT NULL,"
+        "  seconds double precision NOT NULL,"
+        "  sql_queries integer,"
+        "  recorded_at timestamp without time zone NOT NULL"
+        ")"
+    )
+    cr.execute(
+        "CREATE INDEX " + DURATION_TABLE + "_module_action_idx "
+        "ON " + DURATION_TABLE + " (module, action)"
+    )
+
+
+def save_module_durations(cr, modules):
+    """Store the durations of modules recorded by ModuleTimings.
+
+    modules is a dictionary of module name to stats, see
+    ModuleTimings.modules. Only the last HISTORY_SIZE durations of each
+    module and action are kept.
+    """
+    if not modules:
+        return
+    _ensure_duration_table(cr)
+    module_names = sorted(modules)
+    cr.execute(
+        "INSERT INTO "
+        + DURATION_TABLE
+        + " (module, action, seconds, sql_queries, recorded_at) VALUES "
+        + ", ".join(["(%s, %s, %s, %s, now() AT TIME ZONE 'UTC')"] * len(modules)),
+        [
+            value
+            for module_name in module_names
+            for value in (
+                module_name,
+                modules[module_name]["action"],
+                modules[module_name]["seconds"],
+                modules[module_name]["sql_queries"],
+            )
+        ],
+    )
+    cr.execute(
+        "DELETE FROM " + DURATION_TABLE + " WHERE id IN ("
+        "  SELECT id FROM ("
+        "    SELECT id, row_number() OVER ("
+        "      PARTITION BY module, action ORDER BY id DESC"
+        "    ) AS n FROM " + DURATION_TABLE + " WHERE module = ANY(%s)"
+        "  ) AS history WHERE n > %s"
+        ")",
+        (module_names, HISTORY_SIZE),
+    )
+
+
+def load_module_durations(cr):
+    """Return a dictionary of (module name, action) to the median of its
+    stored durations, in seconds."""
+    if not _duration_table_exists(cr):
+        return {}
+    cr.execute("SELECT module, action, seconds FROM " + DURATION_TABLE)
+    durations = {}
+    for module_name, action, seconds in cr.fetchall():
+        durations.setdefault((module_name, action), []).append(seconds)
+    return {key: statistics.median(seconds) for key, seconds in durations.items()}
+
+
+def _installed_graph(cr):
+    """Return the DependencyGraph of installed modules, with the
+    dependencies stored in the database, which Odoo uses to find the
+    modules to upgrade with a module."""
+    cr.execute(
+        "SELECT m.name, d.name FROM ir_module_module m "
+        "LEFT JOIN ir_module_module_dependency d ON d.module_id = m.id "
+        "WHERE m.state IN %s",
+        (("installed", "to upgrade"),),
+    )
+    depends = {}
+    for module_name, dep in cr.fetchall():
+        module_depends = depends.setdefault(module_name, [])
+        if dep:
+            module_depends.append(dep)
+    return DependencyGraph(depends)
+
+
+def plan_update(cr, modules_to_update, update_all=False):
+    """Return a plan of the update of the installed modules, as a dictionary.
+
+    Odoo upgrades modules_to_update and the installed modules depending on
+    them, and loads the other installed modules. The duration of each
+    module is estimated with the median of its durations stored by
+    previous updates, or, for modules without history, with the median of
+    those of other modules for the same action. The critical path is the
+    chain of dependent modules to upgrade with the longest estimated
+    duration.
+    """
+    graph = _installed_graph(cr)
+    if update_all:
+        modules_to_upgrade = set(graph.names)
+    else:
+        modules_to_upgrade = graph.reverse_dependencies(
+            [module_name for module_name in modules_to_update if module_name in graph]
+        )
+    durations = load_module_durations(cr)
+    defaults = {}
+    for action in ("load", "upgrade"):
+        action_durations = [
+            seconds
+            for (_, key_action), seconds in durations.items()
+            if key_action == action
+        ]
+        defaults[action] = (
+            statistics.median(action_durations) if action_durations else 0.0
+        )
+    modules = []
+    estimates = {}
+    for module_name in graph.topological_order():
+        action = "upgrade" if module_name in modules_to_upgrade else "load"
+        seconds = durations.get((module_name, action))
+        if seconds is None:
+            estimates[module_name] = defaults[action]
+        else:
+            estimates[module_name] = seconds
+        modules.append(
+            {
+                "module": module_name,
+                "action": action,
+                "estimated_seconds": estimates[module_name],
+                "history": seconds is not None,
+            }
+        )
+    # longest chain of modules to upgrade, each depending on the previous one
+    path_seconds = {}
+    previous = {}
+    for module_name in graph.topological_order(modules_to_upgrade):
+        best = None
+        for dep in graph.depends(module_name):
+            if dep in path_seconds and (
+                best is None or path_seconds[dep] > path_seconds[best]
+            ):
+                best = dep
+        path_seconds[module_name] = estimates[module_name] + (
+            path_seconds[best] if best else 0.0
+        )
+        previous[module_name] = best
+    critical_path = []
+    if path_seconds:
+        module_name = max(sorted(path_seconds), key=path_seconds.__getitem__)
+        while module_name:
+            critical_path.append(module_name)
+            module_name = previous[module_name]
+        critical_path.reverse()
+    upgrade_seconds = sum(estimates[module_name] for module_name in modules_to_upgrade)
+    load_seconds = sum(
+        estimates[module_name]
+        for module_name in graph.names
+        if module_name not in modules_to_upgrade
+    )
+    return {
+        "odoo_version": odoo.release.version,
+        "modules_to_update": sorted(modules_to_update),
+        "modules_to_upgrade": graph.topological_order(modules_to_upgrade),
+        "estimated_seconds": upgrade_seconds + load_seconds,
+        "upgrade_seconds": upgrade_seconds,
+        "load_seconds": load_seconds,
+        "critical_path": {
+            "modules": critical_path,
+            "seconds": path_seconds[critical_path[-1]] if critical_path else 0.0,
+        },
+        "modules_without_history": sorted(
+            module["module"] for module in modules if not module["history"]
+        ),
+        "modules": modules,
+    }
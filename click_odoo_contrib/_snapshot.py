@@ -0,0 +1,186 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from ._cache import write_json
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+
+def _normalize_langs(keep_langs):
+    # only the language part of language codes is used to select .po files
+    return sorted({lang.split("_")[0] for lang in keep_langs})
+
+
+def _normalize_path(path):
+    return os.path.realpath(path) if path else path
+
+
+def _lock_path(path):
+    return path + ".lock"
+
+
+@contextmanager
+def watcher_lock(path):
+    """Hold the lock telling that the snapshot at path is maintained by a
+    running watcher, while the block runs.
+
+    The lock is an flock on a file next to the snapshot, so it is released
+    by the kernel when the watcher exits, however it exits, and it is seen
+    from other pid namespaces (e.g. containers sharing the snapshot).
+    """
+    fd = os.open(_lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise OSError("Another watcher maintains {}".format(path))
+        yield
+    finally:
+        os.close(fd)
+
+
+def _watcher_running(path):
+    if fcntl is None or not path:
+        return False
+    try:
+        fd = os.open(_lock_path(path), os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+class ChecksumsSnapshot:
+    """Addon checksums computed in advance, for a given addons path.
+
+    A snapshot is only used when the addons path, exclude patterns,
+    languages, checksum mode and algorithm it has been computed with
+    are the ones in use. Addons are not read to validate checksums,
+    so the snapshot must be computed again when addons change, unless
+    it is maintained by a watcher process, in which case it is only used
+    while that process holds its watcher_lock.
+    """
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        self._mismatches = {}
+
+    @classmethod
+    def create(
+        cls,
+        addons_path,
+        exclude_patterns,
+        keep_langs,
+        checksum_mode,
+        checksum_algorithm,
+        module_paths,
+        hashes,
+        watched=False,
+    ):
+        snapshot = cls(
+            {
+                "version": SNAPSHOT_VERSION,
+                "addons_path": [_normalize_path(p) for p in addons_path],
+                "exclude_patterns": list(exclude_patterns),
+                "keep_langs": _normalize_langs(keep_langs),
+                "checksum_mode": checksum_mode,
+                "checksum_algorithm": checksum_algorithm,
+                "watched": watched,
+                "modules": {},
+            }
+        )
+        snapshot.update_modules(module_paths, hashes)
+        return snapshot
+
+    def update_modules(self, module_paths, hashes, removed_module_names=()):
+        modules = self.data["modules"]
+        for module_name in removed_module_names:
+            modules.pop(module_name, None)
+        for module_name, (checksum, tree) in hashes.items():
+            modules[module_name] = {
+                "path": _normalize_path(module_paths[module_name]),
+                "checksum": checksum,
+                "tree": tree,
+            }
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f), path)
+
+    def save(self, path):
+        if not write_json(path, self.data):
+            raise OSError("Could not write checksums snapshot {}".format(path))
+
+    def _mismatch(
+        self,
+        addons_path,
+        exclude_patterns,
+        keep_langs,
+        checksum_mode,
+        checksum_algorithm,
+    ):
+        data = self.data
+        if data.get("version") != SNAPSHOT_VERSION:
+            return "unsupported version"
+        if data["addons_path"] != [_normalize_path(p) for p in addons_path]:
+            return "different addons path"
+        if data["exclude_patterns"] != list(exclude_patterns):
+            return "different exclude patterns"
+        if data["keep_langs"] != _normalize_langs(keep_langs):
+            return "different languages"
+        if data["checksum_mode"] != checksum_mode:
+            return "different checksum mode"
+        if data["checksum_algorithm"] != checksum_algorithm:
+            return "different checksum algorithm"
+        if data.get("watched") and not _watcher_running(self.path):
+            return "its watcher is not running"
+        return None
+
+    def is_valid(
+        self,
+        addons_path,
+        exclude_patterns,
+        keep_langs,
+        checksum_mode,
+        checksum_algorithm,
+    ):
+        """Tell if the snapshot has been computed with these parameters."""
+        key = (
+            tuple(addons_path),
+            tuple(exclude_patterns),
+            tuple(keep_langs),
+            checksum_mode,
+            checksum_algorithm,
+        )
+        if key not in self._mismatches:
+            mismatch = self._mismatch(*key)
+            if mismatch:
+                _logger.warning("Ignoring checksums snapshot: %s.", mismatch)
+            self._mismatches[key] = mismatch
+        return not self._mismatches[key]
+
+    def get(self, module_name, module_path):
+        """Return (checksum, file tree) of a module, or None if unknown."""
+        module = self.data["modules"].get(module_name)
+        if not module or module["path"] != _normalize_path(module_path):
+            return None
+        return module["checksum"], module["tree"]
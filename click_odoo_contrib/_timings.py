@@ -0,0 +1,204 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from click_odoo import odoo
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+_logger = logging.getLogger(__name__)
+
+ACTIONS = {"to install": "install", "to upgrade": "upgrade"}
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModuleTimings:
+    """Record the time, SQL queries and memory spent on each module while
+    Odoo loads, installs or upgrades modules.
+
+    Odoo loads modules one after the other in load_module_graph, starting
+    each with load_openerp_module, so everything from that call to the
+    next one, or to the end of load_module_graph, is accounted to the
+    module. These functions are wrapped without changing their behaviour;
+    if an Odoo version does not have them, only the total is recorded.
+
+    SQL query times need Odoo >= 13. The python memory delta is only
+    recorded when tracemalloc is tracing (e.g. with PYTHONTRACEMALLOC=1),
+    as it slows down Odoo a lot; the growth of the maximum resident set
+    size is always recorded.
+    """
+
+    def __init__(self):
+        self.modules = {}  # module name -> stats
+        self._states = {}  # module name -> state when its graph was loaded
+        self._current = None  # (module name, counters when it started)
+        self._in_graph = False
+        self._patches = []  # (namespace, name, original function)
+        self._start = None
+        self.total_seconds = None
+
+    def _counters(self):
+        thread = threading.current_thread()
+        if odoo.release.version_info >= (13, 0):
+            sql_queries = getattr(thread, "query_count", 0)
+            sql_seconds = getattr(thread, "query_time", 0.0)
+        else:
+            sql_queries = getattr(odoo.sql_db, "sql_counter", 0)
+            sql_seconds = None
+        return {
+            "seconds": time.perf_counter(),
+            "sql_queries": sql_queries,
+            "sql_seconds": sql_seconds,
+            "python_memory": (
+                tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            ),
+            "max_rss": _max_rss(),
+        }
+
+    def _switch(self, module_name):
+        """End the current module, and start module_name if not None."""
+        counters = self._counters()
+        if self._current:
+            current_name, start = self._current
+            stats = self.modules.setdefault(
+                current_name,
+                {
+                    "action": "load",
+                    "seconds": 0.0,
+                    "sql_queries": 0,
+                    "sql_seconds": None if start["sql_seconds"] is None else 0.0,
+                    "python_memory_delta": None,
+                    "max_rss_delta": None,
+                },
+            )
+            action = ACTIONS.get(self._states.get(current_name))
+            if action:
+                stats["action"] = action
+            for key in ("seconds", "sql_queries", "sql_seconds"):
+                if start[key] is not None:
+                    stats[key] += counters[key] - start[key]
+            for key in ("python_memory", "max_rss"):
+                if start[key] is not None:
+                    stats[key + "_delta"] = (
+                        (stats[key + "_delta"] or 0) + counters[key] - start[key]
+                    )
+        self._current = (module_name, counters) if module_name else None
+
+    def _patch(self, namespace, name, wrapper_factory):
+        original = getattr(namespace, name, None)
+        if original is None:
+            return False
+        setattr(namespace, name, wrapper_factory(original))
+        self._patches.append((namespace, name, original))
+        return True
+
+    def _wrap_load_openerp_module(self, original):
+        def load_openerp_module(module_name, *args, **kwargs):
+            # server wide modules are also loaded outside of module graphs
+            if self._in_graph:
+                self._switch(module_name)
+            return original(module_name, *args, **kwargs)
+
+        return load_openerp_module
+
+    def _wrap_load_module_graph(self, original):
+        def load_module_graph(*args, **kwargs):
+            graph = args[1] if len(args) > 1 else kwargs.get("graph")
+            try:
+                for package in graph:
+                    self._states[package.name] = getattr(package, "state", None)
+            except Exception:
+                _logger.debug("Could not read module states", exc_info=True)
+            self._in_graph = True
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self._in_graph = False
+                self._switch(None)
+
+        return load_module_graph
+
+    def start(self):
+        thread = threading.current_thread()
+        if odoo.release.version_info >= (13, 0) and not hasattr(thread, "query_count"):
+            # Odoo counts queries of threads having these attributes
+            thread.query_count = 0
+            thread.query_time = 0.0
+        loading = odoo.modules.loading
+        patched = self._patch(
+            loading, "load_module_graph", self._wrap_load_module_graph
+        ) and (
+            self._patch(loading, "load_openerp_module", self._wrap_load_openerp_module)
+            or self._patch(
+                odoo.modules.module,
+                "load_openerp_module",
+                self._wrap_load_openerp_module,
+            )
+        )
+        if not patched:
+            _logger.warning(
+                "Module timings are not supported by this Odoo version, "
+                "only the total time is recorded."
+            )
+        self._start = time.perf_counter()
+
+    def stop(self):
+        self._switch(None)
+        self.total_seconds = time.perf_counter() - self._start
+        while self._patches:
+            namespace, name, original = self._patches.pop()
+            setattr(namespace, name, original)
+
+    def report(self, **info):
+        """Return the report as a dictionary, with additional info."""
+        modules = [
+            dict(stats, module=module_name)
+            for module_name, stats in self.modules.items()
+        ]
+        modules.sort(key=lambda stats: stats["seconds"], reverse=True)
+        report = dict(info)
+        report.update(
+            {
+                "odoo_version": odoo.release.version,
+                "total_seconds": self.total_seconds,
+                "modules_seconds": sum(stats["seconds"] for stats in modules),
+                "modules": modules,
+            }
+        )
+        return report
+
+
+@contextmanager
+def record_module_timings(report_path=None, record=False, **info):
+    """Record ModuleTimings while the block runs, if report_path or record
+    is set, and write the report to report_path, if set, including
+    additional info, when the block exits, even with an error. Yield the
+    ModuleTimings, or None if they are not recorded."""
+    if not report_path and not record:
+        yield None
+        return
+    timings = ModuleTimings()
+    timings.start()
+    try:
+        yield timings
+    finally:
+        timings.stop()
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(timings.report(**info), f, indent=2)
+            _logger.info("Module timings written to %s", report_path)
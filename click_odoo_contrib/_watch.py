@@ -0,0 +1,136 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import logging
+import os
+
+from ._addon_hash import compile_exclude_patterns
+
+try:
+    import inotify_simple
+except ImportError:  # pragma: no cover
+    inotify_simple = None
+
+_logger = logging.getLogger(__name__)
+
+# events are collected for this many milliseconds after the first one,
+# so saving several files at once triggers one rehash
+READ_DELAY_MS = 200
+
+
+def _parent_paths(addons_dir, relpath):
+    """Return the real paths of the parent directories of relpath, up to
+    addons_dir."""
+    parts = relpath.split(os.sep)[:-1]
+    return frozenset(
+        os.path.realpath(os.path.join(addons_dir, *parts[:i]))
+        for i in range(len(parts) + 1)
+    )
+
+
+class AddonsWatcher:
+    """Watch addons directories with inotify, and tell which addons changed.
+
+    Directories of addons matching exclude patterns are not watched.
+    Symbolic links to directories are followed, watching their targets.
+    This requires Linux and the inotify_simple library. Large addons paths
+    may need a higher fs.inotify.max_user_watches sysctl.
+    """
+
+    def __init__(self, addons_dirs, exclude_patterns):
+        if inotify_simple is None:
+            raise RuntimeError("Watching addons requires the inotify_simple library")
+        flags = inotify_simple.flags
+        self._flags = flags
+        self._mask = (
+            flags.MODIFY
+            | flags.ATTRIB
+            | flags.CLOSE_WRITE
+            | flags.MOVED_FROM
+            | flags.MOVED_TO
+            | flags.CREATE
+            | flags.DELETE
+            | flags.DELETE_SELF
+            | flags.MOVE_SELF
+        )
+        self._exclude_patterns = compile_exclude_patterns(tuple(exclude_patterns))
+        self._inotify = inotify_simple.INotify()
+        # watch descriptor -> {(addons_dir, relative path)}, as a directory
+        # may be reached through several symbolic links
+        self._watches = {}
+        for addons_dir in addons_dirs:
+            self._watch(addons_dir, "")
+
+    def close(self):
+        self._inotify.close()
+
+    def _watch(self, addons_dir, reldir, parent_paths=frozenset()):
+        # inotify watches the target of symbolic links, so watch it
+        # explicitly, and stop at links to a parent directory
+        path = os.path.realpath(os.path.join(addons_dir, reldir))
+        if path in parent_paths:
+            return
+        try:
+            wd = self._inotify.add_watch(path, self._mask)
+        except (FileNotFoundError, NotADirectoryError):
+            # removed in the meantime, or not a directory anymore
+            return
+        self._watches.setdefault(wd, set()).add((addons_dir, reldir))
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        parent_paths = parent_paths | {path}
+        for entry in entries:
+            if entry.is_dir():
+                subdir = os.path.join(reldir, entry.name)
+                if not self._excluded_dir(subdir):
+                    self._watch(addons_dir, subdir, parent_paths)
+
+    def _excluded_dir(self, reldir):
+        # exclude patterns are relative to the addon directory
+        addon_reldir = reldir.partition(os.sep)[2]
+        return bool(addon_reldir) and self._exclude_patterns.match_dir(addon_reldir)
+
+    def _excluded_file(self, relpath):
+        addon_relpath = relpath.partition(os.sep)[2]
+        return bool(addon_relpath) and self._exclude_patterns.match(addon_relpath)
+
+    def read(self, timeout=None, read_delay=READ_DELAY_MS):
+        """Wait for changes, and return the names of addons that changed.
+
+        Return None if events were lost, in which case any addon may
+        have changed. timeout and read_delay are in milliseconds: an empty
+        set is returned when timeout expires, and events are collected for
+        read_delay after the first one.
+        """
+        flags = self._flags
+        changed = set()
+        for event in self._inotify.read(timeout=timeout, read_delay=read_delay):
+            if event.mask & flags.Q_OVERFLOW:
+                _logger.warning("Too many changes, some were lost.")
+                return None
+            if event.mask & flags.IGNORED:
+                # the directory was removed
+                self._watches.pop(event.wd, None)
+                continue
+            for addons_dir, reldir in self._watches.get(event.wd, ()):
+                relpath = os.path.join(reldir, event.name) if event.name else reldir
+                if not relpath:
+                    continue
+                is_dir = event.mask & flags.ISDIR or (
+                    # a new symbolic link to a directory
+                    event.mask & (flags.CREATE | flags.MOVED_TO)
+                    and os.path.isdir(os.path.join(addons_dir, relpath))
+                )
+                if is_dir:
+                    if self._excluded_dir(relpath):
+                        continue
+                    if event.mask & (flags.CREATE | flags.MOVED_TO):
+                        self._watch(
+                            addons_dir, relpath, _parent_paths(addons_dir, relpath)
+                        )
+                elif self._excluded_file(relpath):
+                    continue
+                changed.add(relpath.split(os.sep)[0])
+        return changed
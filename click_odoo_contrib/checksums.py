@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import logging
+from contextlib import closing
+
+import click
+import click_odoo
+
+from . import _watch
+from ._addon_hash import ALGORITHMS, DEFAULT_ALGORITHM, HashCache
+from ._cache import default_cache_dir
+from ._snapshot import ChecksumsSnapshot, watcher_lock
+from .manifest import _get_addons_path, addon_index
+from .update import (
+    CHECKSUM_MODE_CONTENT,
+    CHECKSUM_MODE_GIT,
+    CHECKSUM_MODES,
+    DEFAULT_EXCLUDE_PATTERNS,
+    _hash_addons,
+    _parse_exclude_patterns,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+def _hash_all_addons(
+    module_names,
+    exclude_patterns,
+    keep_langs,
+    hash_cache,
+    hash_jobs,
+    checksum_mode,
+    checksum_algorithm,
+):
+    """Return (module paths, hashes) of modules found in the addons path."""
+    hashes = _hash_addons(
+        module_names,
+        exclude_patterns,
+        keep_langs,
+        hash_cache,
+        hash_jobs,
+        checksum_mode,
+        checksum_algorithm,
+        with_trees=False,
+    )
+    hashes = {
+        module_name: module_hash
+        for module_name, module_hash in hashes.items()
+        if module_hash[0]
+    }
+    addons_path = _get_addons_path()
+    module_paths = {
+        module_name: addon_index.addon_dir(module_name, addons_path)
+        for module_name in hashes
+    }
+    return module_paths, hashes
+
+
+def compute_checksums_snapshot(
+    exclude_patterns,
+    keep_langs,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=CHECKSUM_MODE_CONTENT,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    watched=False,
+):
+    """Compute the checksums of all addons in the addons path."""
+    module_paths, hashes = _hash_all_addons(
+        addon_index.addon_names(),
+        exclude_patterns,
+        keep_langs,
+        hash_cache,
+        hash_jobs,
+        checksum_mode,
+        checksum_algorithm,
+    )
+    return ChecksumsSnapshot.create(
+        _get_addons_path(),
+        exclude_patterns,
+        keep_langs,
+        checksum_mode,
+        checksum_algorithm,
+        module_paths,
+        hashes,
+        watched,
+    )
+
+
+def watch_checksums_snapshot(
+    output,
+    exclude_patterns,
+    keep_langs,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=CHECKSUM_MODE_CONTENT,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+):
+    """Keep the checksums snapshot of the addons path up to date.
+
+    Addons directories are watched with inotify, and the checksums of
+    addons that change are computed again, until interrupted. Changed
+    addons are first removed from the snapshot, so click-odoo-update
+    hashes them itself until their new checksums are stored. The snapshot
+    is only used while this function holds its watcher_lock.
+    """
+
+    def remove_modules(module_names):
+        if module_names is None:
+            # any addon may have changed
+            module_names = list(snapshot.data["modules"])
+        snapshot.update_modules({}, {}, module_names)
+        snapshot.save(output)
+
+    with watcher_lock(output), closing(
+        _watch.AddonsWatcher(_get_addons_path(), exclude_patterns)
+    ) as watcher:
+        # changes are watched before the first snapshot, so none is missed
+        snapshot = compute_checksums_snapshot(
+            exclude_patterns,
+            keep_langs,
+            hash_cache,
+            hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+            watched=True,
+        )
+        snapshot.save(output)
+        _logger.info("Watching addons, checksums are stored in %s", output)
+        while True:
+            module_names = watcher.read(read_delay=0)
+            if module_names is not None and not module_names:
+                continue
+            remove_modules(module_names)
+            # wait until changes stop, e.g. when several files are saved
+            while True:
+                more_module_names = watcher.read(
+                    timeout=_watch.READ_DELAY_MS, read_delay=0
+                )
+                if more_module_names is not None and not more_module_names:
+                    break
+                if module_names is not None:
+                    module_names = (
+                        None
+                        if more_module_names is None
+                        else module_names | more_module_names
+                    )
+                remove_modules(more_module_names)
+            # addons may have been added, removed or changed manifest
+            addon_index.clear()
+            if module_names is None:
+                snapshot = compute_checksums_snapshot(
+                    exclude_patterns,
+                    keep_langs,
+                    hash_cache,
+                    hash_jobs,
+                    checksum_mode,
+                    checksum_algorithm,
+                    watched=True,
+                )
+            else:
+                _logger.info("Addons changed: %s", ",".join(sorted(module_names)))
+                module_paths, hashes = _hash_all_addons(
+                    sorted(module_names),
+                    exclude_patterns,
+                    keep_langs,
+                    hash_cache,
+                    hash_jobs,
+                    checksum_mode,
+                    checksum_algorithm,
+                )
+                snapshot.update_modules(module_paths, hashes)
+            snapshot.save(output)
+
+
+@click.command()
+@click_odoo.env_options(
+    default_log_level="warn",
+    with_database=False,
+    with_rollback=False,
+    with_addons_path=True,
+)
+@click.option(
+    "--output",
+    "-o",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="Checksums snapshot file to write.",
+)
+@click.option(
+    "--exclude-patterns",
+    default=DEFAULT_EXCLUDE_PATTERNS,
+    show_default=True,
+    help="Comma-separated list of file patterns excluded from checksums. "
+    "It must match the module_auto_update.exclude_patterns system "
+    "parameter of the databases.",
+)
+@click.option(
+    "--languages",
+    default="en_US",
+    show_default=True,
+    help="Comma-separated list of languages whose translations are included "
+    "in checksums. It must match the active languages of the databases.",
+)
+@click.option(
+    "--checksum-mode",
+    type=click.Choice(CHECKSUM_MODES),
+    default=CHECKSUM_MODE_CONTENT,
+    show_default=True,
+    help="How addon checksums are computed, see click-odoo-update.",
+)
+@click.option(
+    "--checksum-algorithm",
+    type=click.Choice(sorted(ALGORITHMS)),
+    default=DEFAULT_ALGORITHM,
+    show_default=True,
+    help="Hash algorithm for addon checksums, see click-odoo-update.",
+)
+@click.option(
+    "--hash-cache/--no-hash-cache",
+    default=False,
+    show_default=True,
+    help="Use the on-disk cache of addon checksums, see click-odoo-update.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running, and update the snapshot when addons change. This "
+    "uses inotify, so it requires Linux and the inotify_simple library, and "
+    "does not support the git checksum mode. The watcher holds a lock on "
+    "the snapshot file followed by .lock, and click-odoo-update ignores the "
+    "snapshot when it is not held.",
+)
+@click.option(
+    "--hash-jobs",
+    type=click.IntRange(min=1),
+    help="Number of threads used to compute addon checksums. "
+    "Default: the number of CPUs.",
+)
+def main(
+    env,
+    output,
+    exclude_patterns,
+    languages,
+    checksum_mode,
+    checksum_algorithm,
+    hash_cache,
+    watch,
+    hash_jobs,
+):
+    """Compute the checksums of all addons in the addons path, and store
+    them in a snapshot file.
+
+    This is meant to be run when addons are deployed, for instance when
+    building a container image. `click-odoo-update --checksums-snapshot`
+    then finds addons to update without reading them, provided the
+    databases use the same exclude patterns and languages.
+
+    With --watch, it keeps running and updates the snapshot as addons
+    change, for instance on development or staging hosts. Changed addons
+    are removed from the snapshot as soon as inotify reports the change,
+    so click-odoo-update hashes them itself until their new checksums are
+    stored.
+    """
+    exclude_patterns = _parse_exclude_patterns(exclude_patterns)
+    keep_langs = [lang.strip() for lang in languages.split(",") if lang.strip()]
+    if watch and checksum_mode == CHECKSUM_MODE_GIT:
+        raise click.ClickException("--watch does not support the git checksum mode")
+    if watch and _watch.inotify_simple is None:
+        raise click.ClickException("--watch requires the inotify_simple library")
+    hash_cache = HashCache(default_cache_dir() if hash_cache else None)
+    try:
+        if watch:
+            try:
+                watch_checksums_snapshot(
+                    output,
+                    exclude_patterns,
+                    keep_langs,
+                    hash_cache,
+                    hash_jobs,
+                    checksum_mode,
+                    checksum_algorithm,
+                )
+            except KeyboardInterrupt:
+                _logger.info("Stopped watching addons.")
+            except OSError as e:
+                raise click.ClickException(str(e))
+            return
+        snapshot = compute_checksums_snapshot(
+            exclude_patterns,
+            keep_langs,
+            hash_cache,
+            hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+        )
+    finally:
+        hash_cache.save()
+    try:
+        snapshot.save(output)
+    except OSError as e:
+        raise click.ClickException(str(e))
+    _logger.info(
+        "Stored checksums of %d addons in %s", len(snapshot.data["modules"]), output
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
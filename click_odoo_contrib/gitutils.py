@@ -17,3 +17,75 @@ def commit_if_needed(paths, message, cwd="."):
         return True
     else:
         return False
+
+
+def _git_output(cmd, cwd):
+    return subprocess.check_output(
+        ["git"] + cmd, cwd=cwd, stderr=subprocess.DEVNULL, universal_newlines=True
+    )
+
+
+def _git_dirty_paths(relpaths, cwd):
+    """Return paths with uncommitted changes or untracked files."""
+    output = _git_output(
+        ["status", "--porcelain", "-z", "--untracked-files=all", "--"] + relpaths,
+        cwd=cwd,
+    )
+    dirty = set()
+    entries = iter(output.split("\0"))
+    for entry in entries:
+        if not entry:
+            continue
+        dirty.add(entry[3:])
+        if entry[0] in "RC":
+            # renames and copies are followed by the original path
+            dirty.add(next(entries))
+    return dirty
+
+
+def git_tree_ids(paths):
+    """Return a dictionary of directory to the id of its git tree at HEAD.
+
+    Only directories that are tracked by git and have neither uncommitted
+    changes nor untracked files are returned. Directories are grouped by
+    parent directory, so a few git commands are run for each parent
+    directory, whatever the number of directories.
+    """
+    res = {}
+    paths_by_parent = {}
+    for path in paths:
+        parent = os.path.dirname(os.path.realpath(path))
+        paths_by_parent.setdefault(parent, []).append(path)
+    for parent, parent_paths in sorted(paths_by_parent.items()):
+        try:
+            toplevel = _git_output(["rev-parse", "--show-toplevel"], cwd=parent)
+        except (OSError, subprocess.CalledProcessError):
+            # git not installed or not in a git repository
+            continue
+        toplevel = os.path.realpath(toplevel.strip())
+        relpaths = {
+            os.path.relpath(os.path.realpath(path), toplevel): path
+            for path in parent_paths
+        }
+        try:
+            output = _git_output(
+                ["ls-tree", "-z", "HEAD", "--"] + sorted(relpaths), cwd=toplevel
+            )
+        except subprocess.CalledProcessError:
+            # no commit yet
+            continue
+        tree_ids = {}
+        for entry in output.split("\0"):
+            if not entry:
+                continue
+            info, relpath = entry.split("\t", 1)
+            _, object_type, object_id = info.split()
+            if object_type == "tree":
+                tree_ids[relpath] = object_id
+        dirty = _git_dirty_paths(sorted(tree_ids), cwd=toplevel) if tree_ids else ()
+        for relpath, object_id in tree_ids.items():
+            prefix = relpath + "/"
+            if any(p == relpath or p.startswith(prefix) for p in dirty):
+                continue
+            res[relpaths[relpath]] = object_id
+    return res
@@ -4,18 +4,24 @@
 import contextlib
 import hashlib
 import logging
-import os
 import re
 from datetime import datetime, timedelta
-from fnmatch import fnmatch
 
 import click
 import click_odoo
 from click_odoo import odoo
 
+from ._addon_hash import ALGORITHMS, DEFAULT_ALGORITHM, HashCache
+from ._cache import default_cache_dir
 from ._dbutils import advisory_lock, db_exists, db_initialized, pg_connect
-from .manifest import expand_dependencies
-from .update import _save_installed_checksums
+from ._timings import record_module_timings
+from .manifest import addon_index, expand_dependencies
+from .update import (
+    CHECKSUM_MODE_CONTENT,
+    CHECKSUM_MODES,
+    _hash_addons,
+    _save_installed_checksums,
+)
 
 _logger = logging.getLogger(__name__)
 
@@ -59,26 +65,38 @@ def _patch_ir_attachment_store(force_db_storage):
             IrAttachment._storage = orig
 
 
-def odoo_createdb(dbname, demo, module_names, force_db_storage, exists):
+def odoo_createdb(
+    dbname,
+    demo,
+    module_names,
+    force_db_storage,
+    exists,
+    checksum_mode=CHECKSUM_MODE_CONTENT,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    hash_cache=None,
+    hash_jobs=None,
+    timings_report=None,
+):
     with _patch_ir_attachment_store(force_db_storage):
         if not exists:
             odoo.service.db._create_empty_database(dbname)
-        if odoo.release.version_info >= (19, 0):
-            odoo.tools.config["with_demo"] = demo
-            odoo.modules.registry.Registry.new(
-                dbname,
-                new_db_demo=demo,
-                update_module=True,
-                install_modules=module_names,
-            )
-        else:
-            odoo.tools.config["without_demo"] = not demo
-            odoo.tools.config["init"] = dict.fromkeys(module_names, 1)
-            odoo.modules.registry.Registry.new(
-                dbname,
-                force_demo=demo,
-                update_module=True,
-            )
+        with record_module_timings(timings_report, command="initdb", database=dbname):
+            if odoo.release.version_info >= (19, 0):
+                odoo.tools.config["with_demo"] = demo
+                odoo.modules.registry.Registry.new(
+                    dbname,
+                    new_db_demo=demo,
+                    update_module=True,
+                    install_modules=module_names,
+                )
+            else:
+                odoo.tools.config["without_demo"] = not demo
+                odoo.tools.config["init"] = dict.fromkeys(module_names, 1)
+                odoo.modules.registry.Registry.new(
+                    dbname,
+                    force_demo=demo,
+                    update_module=True,
+                )
         if not exists:
             _logger.info(
                 click.style(f"Created new Odoo database {dbname}.", fg="green")
@@ -88,40 +106,47 @@ def odoo_createdb(dbname, demo, module_names, force_db_storage, exists):
                 click.style(f"Initialized Odoo database {dbname}.", fg="green")
             )
         with odoo.sql_db.db_connect(dbname).cursor() as cr:
-            _save_installed_checksums(cr)
+            _save_installed_checksums(
+                cr,
+                hash_cache=hash_cache,
+                hash_jobs=hash_jobs,
+                checksum_mode=checksum_mode,
+                checksum_algorithm=checksum_algorithm,
+            )
         odoo.sql_db.close_db(dbname)
 
 
-def _fnmatch(filename, patterns):
-    for pattern in patterns:
-        if fnmatch(filename, pattern):
-            return True
-    return False
-
-
-def _walk(top, exclude_patterns=EXCLUDE_PATTERNS):
-    for dirpath, dirnames, filenames in os.walk(top):
-        dirnames.sort()
-        reldir = os.path.relpath(dirpath, top)
-        if reldir == ".":
-            reldir = ""
-        for filename in sorted(filenames):
-            filepath = os.path.join(reldir, filename)
-            if _fnmatch(filepath, exclude_patterns):
-                continue
-            yield filepath
-
+def addons_hash(
+    module_names,
+    with_demo,
+    checksum_mode=CHECKSUM_MODE_CONTENT,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    hash_cache=None,
+    hash_jobs=None,
+):
+    """Compute the template hashsum of modules and their dependencies.
 
-def addons_hash(module_names, with_demo):
+    It combines the checksums of each module, computed like
+    click-odoo-update does, so the digests of unchanged modules
+    can be found in the hash cache.
+    """
+    module_names = sorted(expand_dependencies(module_names, True, True))
+    hashes = _hash_addons(
+        module_names,
+        EXCLUDE_PATTERNS,
+        [],
+        hash_cache,
+        hash_jobs,
+        checksum_mode,
+        checksum_algorithm,
+        with_trees=False,
+    )
+    # template names have room for a sha1 hashsum; checksums are prefixed
+    # by their algorithm, so templates created with another algorithm differ
     h = hashlib.sha1()
     h.update("!demo={}!".format(int(bool(with_demo))).encode("utf8"))
-    for module_name in sorted(expand_dependencies(module_names, True, True)):
-        module_path = odoo.modules.get_module_path(module_name)
-        h.update(module_name.encode("utf8"))
-        for filepath in _walk(module_path):
-            h.update(filepath.encode("utf8"))
-            with open(os.path.join(module_path, filepath), "rb") as f:
-                h.update(f.read())
+    for module_name in module_names:
+        h.update("{}\0{}\n".format(module_name, hashes[module_name][0]).encode("utf8"))
     return h.hexdigest()
 
 
@@ -138,6 +163,7 @@ class DbCache:
     used for that prefix.
     """
 
+    # hashsums are sha1 hex digests, whatever the checksum algorithm
     HASH_SIZE = hashlib.sha1().digest_size * 2
     MAX_HASHSUM = "f" * HASH_SIZE
 
@@ -384,6 +410,48 @@ class DbCache:
         "else create and/or initialize it."
     ),
 )
+@click.option(
+    "--checksum-mode",
+    type=click.Choice(CHECKSUM_MODES),
+    default=CHECKSUM_MODE_CONTENT,
+    show_default=True,
+    help="How addon checksums are computed, for cached templates and for "
+    "click-odoo-update. With git, addons without uncommitted changes nor "
+    "untracked files are identified by their git tree id, so their files "
+    "are not read. With semantic, changing the formatting or comments of "
+    "python, xml and csv files and manifests does not change checksums.",
+)
+@click.option(
+    "--checksum-algorithm",
+    type=click.Choice(sorted(ALGORITHMS)),
+    default=DEFAULT_ALGORITHM,
+    show_default=True,
+    help="Hash algorithm for addon checksums, for cached templates and for "
+    "click-odoo-update. xxh3_128 is available when the xxhash library is "
+    "installed.",
+)
+@click.option(
+    "--hash-cache/--no-hash-cache",
+    default=True,
+    show_default=True,
+    help="Cache addon checksums and manifests on disk, so addons whose files "
+    "did not change are not read again to find a matching template. The "
+    "cache is shared with click-odoo-update.",
+)
+@click.option(
+    "--hash-jobs",
+    type=click.IntRange(min=1),
+    help="Number of threads used to compute addon checksums. "
+    "Default: the number of CPUs.",
+)
+@click.option(
+    "--timings-report",
+    type=click.Path(dir_okay=False),
+    help="Write to this file a JSON report of the time, SQL queries and "
+    "memory spent installing each module, when a database is created without "
+    "a cached template. The python memory delta is only recorded when "
+    "tracemalloc is enabled (PYTHONTRACEMALLOC=1).",
+)
 def main(
     env,
     new_database,
@@ -396,6 +464,11 @@ def main(
     unless_exists,
     unless_initialized,
     attachments_in_db,
+    checksum_mode,
+    checksum_algorithm,
+    hash_cache,
+    hash_jobs,
+    timings_report,
 ):
     """Create or initialize an Odoo database with pre-installed modules.
 
@@ -404,9 +477,9 @@ def main(
     the exact same addons installed. This is particularly useful to
     save time when initializing test databases.
 
-    Cached templates are identified by computing a sha1
-    checksum of modules provided with the -m option, including their
-    dependencies and corresponding auto_install modules.
+    Cached templates are identified by computing a sha1 checksum
+    of the checksums of modules provided with the -m option, including
+    their dependencies and corresponding auto_install modules.
 
     By default, if the database already exists, the script will fail.
     With --unless-exists, the script succeeds but does nothing when the database
@@ -445,46 +518,71 @@ def main(
                     "Database already exists: {}".format(new_database)
                 )
     module_names = [m.strip() for m in modules.split(",")]
-    if not cache:
-        if new_database:
-            odoo_createdb(
-                new_database,
-                demo,
-                module_names,
-                force_db_storage=attachments_in_db,
-                exists=exists,
-            )
-        else:
-            _logger.info(
-                "Cache disabled and no new database name provided. Nothing to do."
-            )
-    else:
-        with pg_connect() as pgcr:
-            dbcache = DbCache(cache_prefix, pgcr)
+    # without the on-disk cache, digests are still cached in memory
+    cache_dir = default_cache_dir() if hash_cache else None
+    hash_cache = HashCache(cache_dir)
+    addon_index.cache_dir = cache_dir
+    try:
+        if not cache:
             if new_database:
-                hashsum = addons_hash(module_names, demo)
-                if not exists and dbcache.create(new_database, hashsum):
-                    _logger.info(
-                        click.style(
-                            "Found matching database template! ✨ 🍰 ✨",
-                            fg="green",
-                            bold=True,
-                        )
-                    )
-                    refresh_module_list(new_database)
-                else:
-                    odoo_createdb(
-                        new_database,
-                        demo,
+                odoo_createdb(
+                    new_database,
+                    demo,
+                    module_names,
+                    force_db_storage=attachments_in_db,
+                    exists=exists,
+                    checksum_mode=checksum_mode,
+                    checksum_algorithm=checksum_algorithm,
+                    hash_cache=hash_cache,
+                    hash_jobs=hash_jobs,
+                    timings_report=timings_report,
+                )
+            else:
+                _logger.info(
+                    "Cache disabled and no new database name provided. Nothing to do."
+                )
+        else:
+            with pg_connect() as pgcr:
+                dbcache = DbCache(cache_prefix, pgcr)
+                if new_database:
+                    hashsum = addons_hash(
                         module_names,
-                        force_db_storage=True,
-                        exists=exists,
+                        demo,
+                        checksum_mode,
+                        checksum_algorithm,
+                        hash_cache,
+                        hash_jobs,
                     )
-                    dbcache.add(new_database, hashsum)
-            if cache_max_size >= 0:
-                dbcache.trim_size(cache_max_size)
-            if cache_max_age >= 0:
-                dbcache.trim_age(timedelta(days=cache_max_age))
+                    if not exists and dbcache.create(new_database, hashsum):
+                        _logger.info(
+                            click.style(
+                                "Found matching database template! ✨ 🍰 ✨",
+                                fg="green",
+                                bold=True,
+                            )
+                        )
+                        refresh_module_list(new_database)
+                    else:
+                        odoo_createdb(
+                            new_database,
+                            demo,
+                            module_names,
+                            force_db_storage=True,
+                            exists=exists,
+                            checksum_mode=checksum_mode,
+                            checksum_algorithm=checksum_algorithm,
+                            hash_cache=hash_cache,
+                            hash_jobs=hash_jobs,
+                            timings_report=timings_report,
+                        )
+                        dbcache.add(new_database, hashsum)
+                if cache_max_size >= 0:
+                    dbcache.trim_size(cache_max_size)
+                if cache_max_age >= 0:
+                    dbcache.trim_age(timedelta(days=cache_max_age))
+    finally:
+        hash_cache.save()
+        addon_index.save()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -2,12 +2,25 @@
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
 import ast
+import hashlib
+import json
 import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from click_odoo import odoo
 
+from ._addon_hash import RACY_NS
+from ._cache import read_json, write_json
+
 MANIFEST_NAMES = ("__manifest__.py", "__openerp__.py")
 
+CACHE_VERSION = 2
+
+# directories are probed and manifests parsed by threads from this many
+PARALLEL_MIN_ITEMS = 16
+
 
 class NoManifestFound(Exception):
     pass
@@ -17,6 +30,15 @@ class ModuleNotFound(Exception):
     pass
 
 
+class DependencyCycle(Exception):
+    def __init__(self, cycles):
+        super().__init__(
+            "dependency cycles: "
+            + "; ".join(", ".join(sorted(cycle)) for cycle in cycles)
+        )
+        self.cycles = cycles
+
+
 def get_manifest_path(addon_dir):
     for manifest_name in MANIFEST_NAMES:
         manifest_path = os.path.join(addon_dir, manifest_name)
@@ -36,64 +58,525 @@ def read_manifest(addon_dir):
         return parse_manifest(mf.read())
 
 
+def _get_addons_path():
+    """Return the list of directories where Odoo looks for addons."""
+    if hasattr(odoo.modules.module, "initialize_sys_path"):
+        odoo.modules.module.initialize_sys_path()
+    return list(odoo.addons.__path__)
+
+
+class AddonIndex:
+    """Addons directories and parsed manifests, read once per process.
+
+    Each addons directory is listed with a single os.scandir pass the
+    first time it is needed, and each manifest is parsed once. Like Odoo,
+    an addon is looked up in the addons path order.
+
+    When cache_dir is set, parsed manifests are also kept on disk, in one
+    cache file per addons directory, and a manifest whose size, mtime,
+    ctime and inode did not change is not parsed again. Addons directories
+    are always listed, so added, removed and renamed addons are found.
+    """
+
+    def __init__(self, cache_dir=None, jobs=None):
+        self.cache_dir = cache_dir
+        # number of threads probing directories and parsing manifests,
+        # which pays off on network file systems or cold disk caches
+        self.jobs = jobs
+        self.clear()
+
+    def clear(self):
+        """Forget everything, when addons may have been changed."""
+        self._addons_dirs = {}  # addons_dir -> {addon_name: addon_dir}
+        self._missing_dirs = set()  # addons path directories that do not exist
+        self._manifest_stats = {}  # addon_dir -> (manifest_path, stat)
+        self._manifests = {}  # addon_dir -> manifest
+        self._cache = {}  # addons_dir -> cache file content
+        self._dirty = set()  # addons dirs with modified cache content
+
+    def _map(self, func, items):
+        """Map func on items, with a thread pool if there are enough."""
+        if self.jobs == 1 or len(items) < PARALLEL_MIN_ITEMS:
+            return list(map(func, items))
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(executor.map(func, items))
+
+    @staticmethod
+    def _probe(addon_dir):
+        for manifest_name in MANIFEST_NAMES:
+            manifest_path = os.path.join(addon_dir, manifest_name)
+            try:
+                st = os.stat(manifest_path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                return manifest_path, st
+        return None
+
+    def addons(self, addons_dir, refresh=False):
+        """Return a dictionary of addon name to directory in addons_dir.
+
+        addons_dir is listed the first time, and again with refresh, in
+        which case the manifests that changed are parsed again.
+        Raise OSError if addons_dir cannot be listed.
+        """
+        addons = None if refresh else self._addons_dirs.get(addons_dir)
+        if addons is None:
+            addons = {}
+            entries = [entry for entry in os.scandir(addons_dir) if entry.is_dir()]
+            probes = self._map(self._probe, [entry.path for entry in entries])
+            for entry, probe in zip(entries, probes):
+                if probe:
+                    addons[entry.name] = entry.path
+                    old_probe = self._manifest_stats.get(entry.path)
+                    if old_probe and self._stat_key(old_probe) != self._stat_key(probe):
+                        self._manifests.pop(entry.path, None)
+                    self._manifest_stats[entry.path] = probe
+            # forget addons that have been removed since the last listing
+            for addon_name, addon_dir in self._addons_dirs.get(addons_dir, {}).items():
+                if addon_name not in addons:
+                    self._manifest_stats.pop(addon_dir, None)
+                    self._manifests.pop(addon_dir, None)
+            self._addons_dirs[addons_dir] = addons
+        return addons
+
+    def _path_addons(self, addons_dir):
+        # like Odoo, ignore directories of the addons path that do not exist
+        if addons_dir in self._missing_dirs:
+            return {}
+        try:
+            return self.addons(addons_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            self._missing_dirs.add(addons_dir)
+            return {}
+
+    def addon_dir(self, addon_name, addons_path=None):
+        """Return the directory of an addon, or None if not found."""
+        if addons_path is None:
+            addons_path = _get_addons_path()
+        for addons_dir in addons_path:
+            addon_dir = self._path_addons(addons_dir).get(addon_name)
+            if addon_dir:
+                return addon_dir
+        return None
+
+    def addon_names(self, addons_path=None):
+        """Return the sorted names of addons in the addons path."""
+        if addons_path is None:
+            addons_path = _get_addons_path()
+        addon_names = set()
+        for addons_dir in addons_path:
+            addon_names.update(self._path_addons(addons_dir))
+        return sorted(addon_names)
+
+    def manifest(self, addon_dir):
+        """Return the parsed manifest of an addon directory."""
+        manifest = self._manifests.get(addon_dir)
+        if manifest is None:
+            if addon_dir in self._manifest_stats:
+                manifest = self._cached_manifest(addon_dir)
+                if manifest is None:
+                    manifest = self._parse_manifest(addon_dir)
+                    self._cache_manifest(addon_dir, manifest)
+            else:
+                # not found in a listed addons directory
+                manifest = read_manifest(addon_dir)
+            self._manifests[addon_dir] = manifest
+        return manifest
+
+    def prefetch(self, addon_dirs):
+        """Parse the manifests of addon directories concurrently.
+
+        Errors are ignored, and raised by manifest().
+        """
+        to_parse = []
+        for addon_dir in addon_dirs:
+            if addon_dir in self._manifests or addon_dir not in self._manifest_stats:
+                continue
+            manifest = self._cached_manifest(addon_dir)
+            if manifest is None:
+                to_parse.append(addon_dir)
+            else:
+                self._manifests[addon_dir] = manifest
+
+        def parse_manifest(addon_dir):
+            try:
+                return self._parse_manifest(addon_dir)
+            except Exception:
+                return None
+
+        for addon_dir, manifest in zip(to_parse, self._map(parse_manifest, to_parse)):
+            if manifest is not None:
+                self._cache_manifest(addon_dir, manifest)
+                self._manifests[addon_dir] = manifest
+
+    def depends(self, addon_dir):
+        return self.manifest(addon_dir).get("depends", ["base"])
+
+    def _cache_path(self, addons_dir):
+        h = hashlib.sha1(addons_dir.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "manifests-{}.json".format(h))
+
+    def _cache_data(self, addons_dir):
+        data = self._cache.get(addons_dir)
+        if data is None:
+            if self.cache_dir:
+                data = read_json(self._cache_path(addons_dir))
+            if (
+                not isinstance(data, dict)
+                or data.get("version") != CACHE_VERSION
+                or data.get("addons_dir") != addons_dir
+            ):
+                data = {
+                    "version": CACHE_VERSION,
+                    "addons_dir": addons_dir,
+                    "addons": {},
+                }
+            self._cache[addons_dir] = data
+        return data
+
+    @staticmethod
+    def _stat_key(probe):
+        manifest_path, st = probe
+        return [
+            os.path.basename(manifest_path),
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_ctime_ns,
+            st.st_ino,
+        ]
+
+    def _cache_key(self, addon_dir):
+        return self._stat_key(self._manifest_stats[addon_dir])
+
+    def _cached_manifest(self, addon_dir):
+        if not self.cache_dir:
+            return None
+        addons_dir, addon_name = os.path.split(addon_dir)
+        entry = self._cache_data(addons_dir)["addons"].get(addon_name)
+        if (
+            isinstance(entry, list)
+            and entry[:-1] == self._cache_key(addon_dir)
+            and isinstance(entry[-1], dict)
+        ):
+            return entry[-1]
+        return None
+
+    def _parse_manifest(self, addon_dir):
+        manifest_path, _ = self._manifest_stats[addon_dir]
+        with open(manifest_path) as mf:
+            return parse_manifest(mf.read())
+
+    def _cache_manifest(self, addon_dir, manifest):
+        if not self.cache_dir:
+            return
+        # manifests modified right now may be modified again without their
+        # mtime changing, and manifests that json can't store as they are
+        # (tuples, keys that are not strings...) are not cached
+        _, st = self._manifest_stats[addon_dir]
+        if st.st_mtime_ns >= int(time.time() * 10**9) - RACY_NS:
+            return
+        try:
+            if json.loads(json.dumps(manifest)) != manifest:
+                return
+        except (TypeError, ValueError):
+            return
+        addons_dir, addon_name = os.path.split(addon_dir)
+        data = self._cache_data(addons_dir)
+        data["addons"][addon_name] = self._cache_key(addon_dir) + [manifest]
+        self._dirty.add(addons_dir)
+
+    def save(self):
+        """Write parsed manifests to the on-disk cache, if enabled."""
+        if not self.cache_dir:
+            return
+        for addons_dir in sorted(self._dirty):
+            data = self._cache[addons_dir]
+            # forget addons that have been removed or renamed
+            addons = self.addons(addons_dir)
+            data["addons"] = {
+                addon_name: entry
+                for addon_name, entry in data["addons"].items()
+                if addon_name in addons
+            }
+            write_json(self._cache_path(addons_dir), data)
+        self._dirty.clear()
+
+
+addon_index = AddonIndex()
+
+
 def find_addons(addons_dir, installable_only=True):
     """yield (addon_name, addon_dir, manifest)"""
-    for addon_name in sorted(os.listdir(addons_dir)):
-        addon_dir = os.path.join(addons_dir, addon_name)
-        try:
-            manifest = read_manifest(addon_dir)
-        except NoManifestFound:
-            continue
+    # addons may have changed since addons_dir was listed
+    addons = sorted(addon_index.addons(addons_dir, refresh=True).items())
+    addon_index.prefetch([addon_dir for _, addon_dir in addons])
+    for addon_name, addon_dir in addons:
+        manifest = addon_index.manifest(addon_dir)
         if installable_only and not manifest.get("installable", True):
             continue
         yield addon_name, addon_dir, manifest
 
 
-def expand_dependencies(module_names, include_auto_install=False, include_active=False):
+def expand_dependencies(
+    module_names, include_auto_install=False, include_active=False, addons_path=None
+):
     """Return a set of module names with their transitive
     dependencies.  This method does not need an Odoo database,
     but requires the addons path to be initialized.
     """
+    if addons_path is None:
+        addons_path = _get_addons_path()
 
     def add_deps(name):
-        if name in res:
-            return
-        res.add(name)
-        path = odoo.modules.get_module_path(name)
-        if not path:
-            raise ModuleNotFound(name)
-        manifest = read_manifest(path)
-        for dep in manifest.get("depends", ["base"]):
-            add_deps(dep)
+        # iterative, so long dependency chains do not hit the recursion limit
+        stack = [name]
+        while stack:
+            name = stack.pop()
+            if name in res:
+                continue
+            res.add(name)
+            path = addon_index.addon_dir(name, addons_path)
+            if not path:
+                raise ModuleNotFound(name)
+            stack.extend(addon_index.depends(path))
 
     res = set()
     for module_name in module_names:
         add_deps(module_name)
+    if include_active or include_auto_install:
+        addon_dirs = [
+            (module_name, addon_index.addon_dir(module_name, addons_path))
+            for module_name in addon_index.addon_names(addons_path)
+        ]
+        addon_index.prefetch([addon_dir for _, addon_dir in addon_dirs])
+        manifests = [
+            (module_name, addon_index.manifest(addon_dir))
+            for module_name, addon_dir in addon_dirs
+        ]
     if include_active:
-        for module_name in sorted(odoo.modules.module.get_modules()):
-            module_path = odoo.modules.get_module_path(module_name)
-            manifest = read_manifest(module_path)
+        for module_name, manifest in manifests:
             if manifest.get("active"):
                 add_deps(module_name)
     if include_auto_install:
-        auto_install_list = []
-        for module_name in sorted(odoo.modules.module.get_modules()):
-            module_path = odoo.modules.get_module_path(module_name)
-            manifest = read_manifest(module_path)
-            if manifest.get("auto_install"):
-                auto_install_list.append((module_name, manifest))
-        retry = True
-        while retry:
-            retry = False
-            for module_name, manifest in auto_install_list:
-                if module_name in res:
-                    continue
-                depends = set(manifest.get("depends", ["base"]))
-                if depends.issubset(res):
-                    # all dependencies of auto_install module are
-                    # installed so we add it
-                    add_deps(module_name)
-                    # retry, in case an auto_install module depends
-                    # on other auto_install modules
-                    retry = True
+        # count the dependencies of each auto_install module that are not
+        # in the result yet, and add the module when this drops to zero
+        unmet = {}
+        waiting = {}  # module name -> auto_install modules depending on it
+        ready = []
+        for module_name, manifest in manifests:
+            if not manifest.get("auto_install") or module_name in res:
+                continue
+            depends = set(manifest.get("depends", ["base"])) - res
+            unmet[module_name] = len(depends)
+            if not depends:
+                ready.append(module_name)
+            for dep in depends:
+                waiting.setdefault(dep, []).append(module_name)
+        while ready:
+            module_name = ready.pop()
+            # all its dependencies are in the result, so it is the only
+            # module added
+            add_deps(module_name)
+            # in case other auto_install modules depend on it
+            for auto_install_name in waiting.pop(module_name, ()):
+                unmet[auto_install_name] -= 1
+                if not unmet[auto_install_name]:
+                    ready.append(auto_install_name)
     return res
+
+
+class DependencyGraph:
+    """Dependency graph of addons.
+
+    It is built from a dictionary of addon name to the names of its
+    direct dependencies. Addons are numbered in name order and edges are
+    stored as lists of integers in both directions, so it scales to tens
+    of thousands of addons. Dependencies that are not in the graph are
+    ignored, and listed in missing.
+
+    Sets of addons closed under dependencies (such as the addons installed
+    in a database) are compared with bitmasks of their transitive
+    dependencies, see is_subset and is_superset.
+    """
+
+    def __init__(self, depends):
+        self.names = sorted(depends)
+        self._ids = {name: i for i, name in enumerate(self.names)}
+        self.missing = {}  # addon name -> dependencies not in the graph
+        self._depends = []
+        self._dependents = [[] for _ in self.names]
+        for i, name in enumerate(self.names):
+            dep_ids = []
+            for dep in sorted(set(depends[name])):
+                dep_id = self._ids.get(dep)
+                if dep_id is None:
+                    self.missing.setdefault(name, []).append(dep)
+                    continue
+                dep_ids.append(dep_id)
+                self._dependents[dep_id].append(i)
+            self._depends.append(dep_ids)
+        self._levels = None
+        self._masks = None
+
+    @classmethod
+    def from_addons_path(cls, addons_path=None, index=None):
+        """Build the graph of all addons in the addons path."""
+        if index is None:
+            index = addon_index
+        if addons_path is None:
+            addons_path = _get_addons_path()
+        addon_dirs = {
+            addon_name: index.addon_dir(addon_name, addons_path)
+            for addon_name in index.addon_names(addons_path)
+        }
+        index.prefetch(list(addon_dirs.values()))
+        return cls(
+            {
+                addon_name: index.depends(addon_dir)
+                for addon_name, addon_dir in addon_dirs.items()
+            }
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def _to_ids(self, names):
+        try:
+            return [self._ids[name] for name in names]
+        except KeyError as e:
+            raise ModuleNotFound(e.args[0])
+
+    def _closure(self, names, edges):
+        seen = set(self._to_ids(names))
+        stack = list(seen)
+        while stack:
+            for j in edges[stack.pop()]:
+                if j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+        return {self.names[i] for i in seen}
+
+    def depends(self, name):
+        """Return the direct dependencies of an addon that are in the graph."""
+        return [self.names[j] for j in self._depends[self._to_ids([name])[0]]]
+
+    def dependents(self, name):
+        """Return the addons depending directly on an addon."""
+        return [self.names[j] for j in self._dependents[self._to_ids([name])[0]]]
+
+    def dependencies(self, names):
+        """Return addons with their transitive dependencies."""
+        return self._closure(names, self._depends)
+
+    def reverse_dependencies(self, names):
+        """Return addons with the addons depending on them transitively."""
+        return self._closure(names, self._dependents)
+
+    def cycles(self):
+        """Return the dependency cycles, as sorted lists of addon names."""
+        # iterative Tarjan's strongly connected components
+        index = [None] * len(self.names)
+        lowlink = [0] * len(self.names)
+        on_stack = [False] * len(self.names)
+        stack = []
+        cycles = []
+        counter = 0
+        for root in range(len(self.names)):
+            if index[root] is not None:
+                continue
+            work = [(root, 0)]
+            while work:
+                i, pos = work.pop()
+                if pos == 0:
+                    index[i] = lowlink[i] = counter
+                    counter += 1
+                    stack.append(i)
+                    on_stack[i] = True
+                deps = self._depends[i]
+                while pos < len(deps):
+                    j = deps[pos]
+                    pos += 1
+                    if index[j] is None:
+                        work.append((i, pos))
+                        work.append((j, 0))
+                        break
+                    if on_stack[j]:
+                        lowlink[i] = min(lowlink[i], index[j])
+                else:
+                    if lowlink[i] == index[i]:
+                        component = []
+                        while True:
+                            j = stack.pop()
+                            on_stack[j] = False
+                            component.append(j)
+                            if j == i:
+                                break
+                        if len(component) > 1 or i in self._depends[i]:
+                            cycles.append(sorted(self.names[j] for j in component))
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[i])
+        return sorted(cycles)
+
+    def levels(self):
+        """Return a dictionary of addon name to topological level.
+
+        Addons without dependencies are at level 0, and other addons one
+        level above their highest dependency, so addons of a level only
+        depend on addons of lower levels. Raise DependencyCycle if
+        dependencies are cyclic.
+        """
+        if self._levels is None:
+            unmet = [len(deps) for deps in self._depends]
+            levels = [0] * len(self.names)
+            ready = [i for i, count in enumerate(unmet) if not count]
+            done = 0
+            while ready:
+                i = ready.pop()
+                done += 1
+                for j in self._dependents[i]:
+                    levels[j] = max(levels[j], levels[i] + 1)
+                    unmet[j] -= 1
+                    if not unmet[j]:
+                        ready.append(j)
+            if done < len(self.names):
+                raise DependencyCycle(self.cycles())
+            self._levels = levels
+        return {name: self._levels[i] for i, name in enumerate(self.names)}
+
+    def topological_order(self, names=None):
+        """Return addons sorted by level then name, dependencies first."""
+        levels = self.levels()
+        if names is None:
+            names = self.names
+        return sorted(names, key=lambda name: (levels[name], name))
+
+    def _mask(self, names):
+        if self._masks is None:
+            self.levels()  # check there is no cycle
+            order = sorted(range(len(self.names)), key=self._levels.__getitem__)
+            masks = [0] * len(self.names)
+            for i in order:
+                mask = 1 << i
+                for j in self._depends[i]:
+                    mask |= masks[j]
+                masks[i] = mask
+            self._masks = masks
+        mask = 0
+        for i in self._to_ids(names):
+            mask |= self._masks[i]
+        return mask
+
+    def is_subset(self, names, other_names):
+        """Tell if names and their dependencies are all in other_names
+        or their dependencies."""
+        return not self._mask(names) & ~self._mask(other_names)
+
+    def is_superset(self, names, other_names):
+        """Tell if names and their dependencies include other_names and
+        their dependencies."""
+        return self.is_subset(other_names, names)
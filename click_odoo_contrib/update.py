@@ -3,13 +3,18 @@
 # Copyright 2024 Michael Tietz (MT Software) <mtietz@mt-software.de>
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
+import base64
+import fnmatch
 import json
 import logging
+import multiprocessing
 import os
 import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing, contextmanager
 from datetime import timedelta
-from time import sleep
+from time import perf_counter, sleep
 
 import click
 import click_odoo
@@ -18,15 +23,40 @@ from click_odoo import OdooEnvironment, odoo
 from manifestoo_core.core_addons import get_core_addons
 from manifestoo_core.odoo_series import OdooSeries
 
-from ._addon_hash import addon_hash
+from ._addon_hash import (
+    ALGORITHMS,
+    DEFAULT_ALGORITHM,
+    HashCache,
+    _tree_files,
+    addon_hash_tree,
+    diff_trees,
+)
+from ._bytecode import precompile_addons
+from ._cache import default_cache_dir
 from ._dbutils import advisory_lock
+from ._planner import plan_update, save_module_durations
+from ._snapshot import ChecksumsSnapshot
+from ._timings import record_module_timings
+from .gitutils import git_tree_ids
+from .manifest import _get_addons_path, addon_index
 
 _logger = logging.getLogger(__name__)
 
 
 PARAM_INSTALLED_CHECKSUMS = "module_auto_update.installed_checksums"
+PARAM_INSTALLED_TREES = "module_auto_update.installed_trees"
 PARAM_EXCLUDE_PATTERNS = "module_auto_update.exclude_patterns"
+# checksums and file trees of installed modules; checksums are mirrored in
+# PARAM_INSTALLED_CHECKSUMS for module_auto_update and previous versions
+CHECKSUM_TABLE = "click_odoo_module_checksum"
 DEFAULT_EXCLUDE_PATTERNS = "*.pyc,*.pyo,i18n/*.pot,i18n_extra/*.pot,static/*,tests/*"
+CHECKSUM_MODE_CONTENT = "content"
+CHECKSUM_MODE_GIT = "git"
+CHECKSUM_MODE_SEMANTIC = "semantic"
+CHECKSUM_MODES = (CHECKSUM_MODE_CONTENT, CHECKSUM_MODE_GIT, CHECKSUM_MODE_SEMANTIC)
+GIT_CHECKSUM_SCHEME = "git"
+# semantic checksums are prefixed by semantic-<algorithm>:
+SEMANTIC_CHECKSUM_SCHEME_PREFIX = "semantic-"
 
 
 class DbLockWatcher(threading.Thread):
@@ -133,21 +163,25 @@ def _get_param(cr, key, default=None):
         return default
 
 
-def _set_param(cr, key, value):
+def _set_params(cr, values):
+    """Create or update system parameters, with one statement."""
+    keys_values = sorted(values.items())
     cr.execute(
-        "UPDATE ir_config_parameter SET value=%s, write_date=now() AT TIME ZONE 'UTC' "
-        "WHERE key=%s",
-        (value, key),
+        "WITH new (key, value) AS (VALUES "
+        + ", ".join(["(%s, %s)"] * len(keys_values))
+        + "), updated AS ("
+        "  UPDATE ir_config_parameter p "
+        "  SET value=new.value, write_date=now() AT TIME ZONE 'UTC' "
+        "  FROM new WHERE p.key=new.key RETURNING p.key"
+        ") "
+        "INSERT INTO ir_config_parameter (key, value, create_date, write_date) "
+        "SELECT key, value, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC' "
+        "FROM new WHERE key NOT IN (SELECT key FROM updated)",
+        [v for key_value in keys_values for v in key_value],
     )
-    if not cr.rowcount:
-        cr.execute(
-            "INSERT INTO ir_config_parameter (key, value, create_date, write_date) "
-            "VALUES (%s, %s, now() AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC')",
-            (key, value),
-        )
 
 
-def _load_installed_checksums(cr):
+def _load_param_checksums(cr):
     value = _get_param(cr, PARAM_INSTALLED_CHECKSUMS)
     if value:
         return json.loads(value)
@@ -155,64 +189,657 @@ def _load_installed_checksums(cr):
         return {}
 
 
-def _save_installed_checksums(cr, ignore_addons=None):
-    checksums = {}
-    cr.execute("SELECT name FROM ir_module_module WHERE state='installed'")
-    for (module_name,) in cr.fetchall():
-        if ignore_addons and module_name in ignore_addons:
-            continue
-        checksums[module_name] = _get_checksum_dir(cr, module_name)
-    _set_param(cr, PARAM_INSTALLED_CHECKSUMS, json.dumps(checksums))
-    _logger.info("Database updated, new checksums stored")
+def _load_param_trees(cr):
+    value = _get_param(cr, PARAM_INSTALLED_TREES)
+    if value:
+        return json.loads(zlib.decompress(base64.b64decode(value)).decode("utf-8"))
+    else:
+        return {}
+
+
+def _checksum_table_exists(cr):
+    cr.execute("SELECT to_regclass(%s) IS NOT NULL", (CHECKSUM_TABLE,))
+    return cr.fetchone()[0]
+
+
+def _format_checksum(scheme, digest):
+    """Return the stored checksum of a digest, False if there is none."""
+    if not digest:
+        return False
+    if scheme == DEFAULT_ALGORITHM:
+        # unprefixed, as stored by previous versions and module_auto_update
+        return digest
+    return scheme + ":" + digest
+
+
+def _parse_checksum(checksum):
+    """Return (scheme, digest) of a stored checksum, (None, None) if it is
+    False. The scheme tells how the checksum was computed: git, a hash
+    algorithm, or semantic- followed by a hash algorithm."""
+    if not checksum:
+        return None, None
+    scheme, sep, digest = checksum.partition(":")
+    if not sep:
+        return DEFAULT_ALGORITHM, checksum
+    return scheme, digest
+
+
+def _encode_tree(tree):
+    if not tree:
+        return None
+    return psycopg2.Binary(zlib.compress(json.dumps(tree).encode("utf-8")))
+
 
+def _decode_tree(value):
+    if value is None:
+        return None
+    return json.loads(zlib.decompress(bytes(value)).decode("utf-8"))
+
+
+def _tree_stats(module_name, tree, with_size=True):
+    """Return (number of files, total size) of the files of a module tree."""
+    if not tree:
+        return None, None
+    filepaths = list(_tree_files(tree))
+    if not with_size:
+        return len(filepaths), None
+    module_path = addon_index.addon_dir(module_name)
+    size = 0
+    for filepath in filepaths:
+        try:
+            size += os.stat(os.path.join(module_path, filepath)).st_size
+        except (OSError, TypeError):
+            # removed in the meantime, or module not found
+            pass
+    return len(filepaths), size
+
+
+def _upsert_checksums(cr, hashes, with_size=True):
+    """Create or replace rows of the checksum table."""
+    if not hashes:
+        return
+    module_names = sorted(hashes)
+    values = []
+    for module_name in module_names:
+        checksum, tree = hashes[module_name]
+        scheme, digest = _parse_checksum(checksum)
+        files_count, size = _tree_stats(module_name, tree, with_size)
+        values.extend(
+            (module_name, scheme, digest, files_count, size, _encode_tree(tree))
+        )
+    # not INSERT ... ON CONFLICT, which needs PostgreSQL 9.5
+    cr.execute(
+        "DELETE FROM " + CHECKSUM_TABLE + " WHERE module = ANY(%s)", (module_names,)
+    )
+    cr.execute(
+        "INSERT INTO "
+        + CHECKSUM_TABLE
+        + " (module, algorithm, digest, files_count, bytes, tree, computed_at) "
+        "VALUES "
+        + ", ".join(
+            ["(%s, %s, %s, %s, %s, %s, now() AT TIME ZONE 'UTC')"] * len(module_names)
+        ),
+        values,
+    )
+
+
+def _ensure_checksum_table(cr):
+    """Create the checksum table if needed, migrating the checksums stored
+    in system parameters by previous versions."""
+    if _checksum_table_exists(cr):
+        return
+    cr.execute(
+        "CREATE TABLE " + CHECKSUM_TABLE + " ("
+        "  module varchar PRIMARY KEY,"
+        "  algorithm varchar,"
+        "  digest varchar,"
+        "  computed_at timestamp without time zone NOT NULL,"
+        "  files_count integer,"
+        "  bytes bigint,"
+        "  tree bytea"
+        ")"
+    )
+    checksums = _load_param_checksums(cr)
+    if checksums:
+        trees = _load_param_trees(cr)
+        # files may have changed since, so their size is not known
+        _upsert_checksums(
+            cr,
+            {
+                module_name: (checksum, trees.get(module_name))
+                for module_name, checksum in checksums.items()
+            },
+            with_size=False,
+        )
+        _logger.info("Migrated %d checksums to %s", len(checksums), CHECKSUM_TABLE)
+    # file trees are only used to log changed files, so they are not
+    # mirrored: previous versions log them as unknown rather than wrong
+    cr.execute("DELETE FROM ir_config_parameter WHERE key=%s", (PARAM_INSTALLED_TREES,))
 
-def _get_checksum_dir(cr, module_name):
-    exclude_patterns = _get_param(cr, PARAM_EXCLUDE_PATTERNS, DEFAULT_EXCLUDE_PATTERNS)
-    exclude_patterns = [p.strip() for p in exclude_patterns.split(",")]
-    cr.execute("SELECT code FROM res_lang WHERE active")
-    keep_langs = [r[0] for r in cr.fetchall()]
 
-    module_path = odoo.modules.module.get_module_path(module_name)
-    if module_path and os.path.isdir(module_path):
-        checksum_dir = addon_hash(module_path, exclude_patterns, keep_langs)
+def _mirror_param_checksums(cr, changed_checksums, deleted_module_names=()):
+    """Apply changes of the checksum table to PARAM_INSTALLED_CHECKSUMS,
+    which the module_auto_update addon and previous versions read.
+
+    Only changed_checksums and deleted_module_names are merged in the
+    parameter, so the checksum table is not read. Being a single json
+    value, the parameter is still rewritten as a whole, which costs a
+    few bytes per installed module.
+    """
+    checksums = _load_param_checksums(cr)
+    checksums.update(changed_checksums)
+    for module_name in deleted_module_names:
+        checksums.pop(module_name, None)
+    _set_params(cr, {PARAM_INSTALLED_CHECKSUMS: json.dumps(checksums)})
+
+
+def _load_installed_checksums(cr, module_names=None):
+    """Return a dictionary of module name to stored checksum, for all
+    modules or only module_names.
+
+    Checksums stored by previous versions in system parameters are read
+    until the checksum table is created.
+    """
+    if not _checksum_table_exists(cr):
+        checksums = _load_param_checksums(cr)
+        if module_names is not None:
+            checksums = {
+                module_name: checksums[module_name]
+                for module_name in module_names
+                if module_name in checksums
+            }
+        return checksums
+    query = "SELECT module, algorithm, digest FROM " + CHECKSUM_TABLE
+    if module_names is None:
+        cr.execute(query)
+    else:
+        cr.execute(query + " WHERE module = ANY(%s)", (list(module_names),))
+    return {
+        module_name: _format_checksum(scheme, digest)
+        for module_name, scheme, digest in cr.fetchall()
+    }
+
+
+def _load_installed_trees(cr, module_names=None):
+    """Return a dictionary of module name to stored file tree, for all
+    modules or only module_names."""
+    if not _checksum_table_exists(cr):
+        trees = _load_param_trees(cr)
+        if module_names is not None:
+            trees = {
+                module_name: trees[module_name]
+                for module_name in module_names
+                if module_name in trees
+            }
+        return trees
+    query = "SELECT module, tree FROM " + CHECKSUM_TABLE + " WHERE tree IS NOT NULL"
+    if module_names is None:
+        cr.execute(query)
+    else:
+        cr.execute(query + " AND module = ANY(%s)", (list(module_names),))
+    return {module_name: _decode_tree(tree) for module_name, tree in cr.fetchall()}
+
+
+def _save_checksums(cr, hashes, full=False):
+    """Store checksums and file trees of modules.
+
+    hashes is a dictionary of module name to (checksum, file tree). Only
+    rows of modules whose checksum changed are written, and then mirrored
+    in PARAM_INSTALLED_CHECKSUMS. With full, rows of other modules are
+    deleted.
+    """
+    _ensure_checksum_table(cr)
+    checksums = _load_installed_checksums(cr, hashes)
+    changed_hashes = {
+        module_name: module_hash
+        for module_name, module_hash in hashes.items()
+        if module_name not in checksums or checksums[module_name] != module_hash[0]
+    }
+    _upsert_checksums(cr, changed_hashes)
+    deleted_module_names = []
+    if full:
+        cr.execute(
+            "DELETE FROM "
+            + CHECKSUM_TABLE
+            + " WHERE NOT module = ANY(%s) RETURNING module",
+            (list(hashes),),
+        )
+        deleted_module_names = [module_name for (module_name,) in cr.fetchall()]
+    if changed_hashes or deleted_module_names:
+        _mirror_param_checksums(
+            cr,
+            {
+                module_name: checksum
+                for module_name, (checksum, _) in changed_hashes.items()
+            },
+            deleted_module_names,
+        )
+
+
+def _delete_installed_checksums(cr, module_names=None):
+    """Delete the stored checksums of all modules or only module_names.
+
+    Before the checksum table is created, all checksums are deleted.
+    """
+    if not _checksum_table_exists(cr):
+        cr.execute(
+            "DELETE FROM ir_config_parameter WHERE key IN %s",
+            ((PARAM_INSTALLED_CHECKSUMS, PARAM_INSTALLED_TREES),),
+        )
+        return
+    if module_names is None:
+        cr.execute("DELETE FROM " + CHECKSUM_TABLE)
+        _set_params(cr, {PARAM_INSTALLED_CHECKSUMS: json.dumps({})})
     else:
-        checksum_dir = False
+        cr.execute(
+            "DELETE FROM " + CHECKSUM_TABLE + " WHERE module = ANY(%s)",
+            (list(module_names),),
+        )
+        _mirror_param_checksums(cr, {}, module_names)
 
-    return checksum_dir
 
+def _parse_exclude_patterns(exclude_patterns):
+    return [p.strip() for p in exclude_patterns.split(",")]
 
-def _get_modules_to_update(cr, ignore_addons=None):
-    if ignore_addons is None:
-        ignore_addons = []
-    modules_to_update = []
-    checksums = _load_installed_checksums(cr)
+
+def _get_checksum_params(cr):
     cr.execute(
-        "SELECT name FROM ir_module_module WHERE state in ('installed', 'to upgrade')"
+        "SELECT (SELECT value FROM ir_config_parameter WHERE key=%s), "
+        "ARRAY(SELECT code FROM res_lang WHERE active ORDER BY code)",
+        (PARAM_EXCLUDE_PATTERNS,),
+    )
+    exclude_patterns, keep_langs = cr.fetchone()
+    exclude_patterns = _parse_exclude_patterns(
+        exclude_patterns or DEFAULT_EXCLUDE_PATTERNS
     )
-    for (module_name,) in cr.fetchall():
-        if not _is_installable(module_name):
+    return exclude_patterns, keep_langs
+
+
+def _scheme_mode_algorithm(scheme, checksum_algorithm):
+    """Return (mode, algorithm) to compute checksums of a scheme, or None."""
+    if scheme == GIT_CHECKSUM_SCHEME:
+        return CHECKSUM_MODE_GIT, checksum_algorithm
+    if scheme in ALGORITHMS:
+        return CHECKSUM_MODE_CONTENT, scheme
+    if scheme.startswith(SEMANTIC_CHECKSUM_SCHEME_PREFIX):
+        algorithm = scheme[len(SEMANTIC_CHECKSUM_SCHEME_PREFIX) :]
+        if algorithm in ALGORITHMS:
+            return CHECKSUM_MODE_SEMANTIC, algorithm
+    return None
+
+
+class ChecksumSession:
+    """Compute, compare and store the module checksums of a database.
+
+    The exclude patterns, active languages and stored checksums of the
+    database are loaded once per session, and only the checksums that
+    changed are written. A session is bound to a cursor; use a new one when
+    the database may have changed, e.g. after updating modules.
+    """
+
+    def __init__(
+        self,
+        cr,
+        hash_cache=None,
+        hash_jobs=None,
+        checksum_mode=None,
+        checksum_algorithm=DEFAULT_ALGORITHM,
+        checksums_snapshot=None,
+    ):
+        self.cr = cr
+        self.hash_cache = hash_cache
+        self.hash_jobs = hash_jobs
+        self.checksum_mode = checksum_mode
+        self.checksum_algorithm = checksum_algorithm
+        self.checksums_snapshot = checksums_snapshot
+        self._checksum_params = None
+        self._installed_checksums = None
+        # stored checksums of the modules checked by modules_to_update
+        self._checked_checksums = {}
+        # module name -> (checksum, file tree) computed in the session mode
+        self.hashes = {}
+
+    @property
+    def checksum_params(self):
+        """(exclude patterns, active languages) of the database."""
+        if self._checksum_params is None:
+            self._checksum_params = _get_checksum_params(self.cr)
+        return self._checksum_params
+
+    @property
+    def installed_checksums(self):
+        if self._installed_checksums is None:
+            self._installed_checksums = _load_installed_checksums(self.cr)
+        return self._installed_checksums
+
+    def module_names(self, states, ignore_addons=None):
+        self.cr.execute(
+            "SELECT name FROM ir_module_module WHERE state in %s", (tuple(states),)
+        )
+        return [
+            module_name
+            for (module_name,) in self.cr.fetchall()
+            if not ignore_addons or module_name not in ignore_addons
+        ]
+
+    def hash_modules(self, module_names, checksum_mode=None, checksum_algorithm=None):
+        """Return a dictionary of module name to (checksum, file tree).
+
+        Checksums are computed with the session checksum mode and
+        algorithm unless others are given, see _hash_addons.
+        """
+        exclude_patterns, keep_langs = self.checksum_params
+        checksums_snapshot = self.checksums_snapshot
+        session_mode = checksum_mode is None and checksum_algorithm is None
+        if session_mode:
+            checksum_mode = self.checksum_mode
+            checksum_algorithm = self.checksum_algorithm
+        else:
+            # the snapshot was computed with the session mode and algorithm
+            checksums_snapshot = None
+        hashes = _hash_addons(
+            module_names,
+            exclude_patterns,
+            keep_langs,
+            self.hash_cache,
+            self.hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+            checksums_snapshot,
+            # only checksums of the session mode are stored with their tree
+            with_trees=session_mode,
+        )
+        if session_mode:
+            self.hashes.update(hashes)
+        return hashes
+
+    def save(self, ignore_addons=None, previous_session=None):
+        """Compute and store the checksums of installed modules.
+
+        Checksums computed by previous_session with the same exclude
+        patterns and languages are reused, instead of hashing modules
+        again. This is meant to store, after an update, the checksums
+        computed before it: should a module change during the update, its
+        new checksum is then seen by the next update.
+        """
+        module_names = self.module_names(["installed"], ignore_addons)
+        hashes = {}
+        if (
+            previous_session is not None
+            and previous_session.checksum_params == self.checksum_params
+        ):
+            hashes = {
+                module_name: previous_session.hashes[module_name]
+                for module_name in module_names
+                if module_name in previous_session.hashes
+            }
+        # modules installed by the update are hashed
+        hashes.update(
+            self.hash_modules(
+                [
+                    module_name
+                    for module_name in module_names
+                    if module_name not in hashes
+                ]
+            )
+        )
+        _save_checksums(self.cr, hashes, full=True)
+        self._installed_checksums = {
+            module_name: checksum for module_name, (checksum, _) in hashes.items()
+        }
+        _logger.info("Database updated, new checksums stored")
+
+    def modules_to_update(self, ignore_addons=None, explain=False):
+        """Return the installed modules whose checksum changed.
+
+        With explain, log which files changed in each of them.
+        """
+        addons_path = _get_addons_path()
+        module_names = [
+            module_name
+            for module_name in self.module_names(
+                ["installed", "to upgrade"], ignore_addons
+            )
             # if the module is not installable, do not try to update it
-            continue
-        if module_name in ignore_addons:
-            continue
-        if _get_checksum_dir(cr, module_name) != checksums.get(module_name):
-            modules_to_update.append(module_name)
-    return modules_to_update
+            if _is_installable(module_name, addons_path)
+        ]
+        checksums = self._installed_checksums
+        if checksums is None:
+            # only read the checksums of the modules being checked
+            checksums = _load_installed_checksums(self.cr, module_names)
+        self._checked_checksums = checksums
+        hashes = self.hash_modules(module_names)
+        modules_to_update = [
+            module_name
+            for module_name in module_names
+            if hashes[module_name][0] != checksums.get(module_name)
+        ]
+        # modules whose checksum was stored with another algorithm or mode are
+        # hashed again the same way, so changing algorithm does not update them
+        modules_by_scheme = {}
+        for module_name in modules_to_update:
+            checksum = checksums.get(module_name)
+            if not checksum:
+                continue
+            scheme, _ = _parse_checksum(checksum)
+            if scheme != _parse_checksum(hashes[module_name][0])[0]:
+                modules_by_scheme.setdefault(scheme, []).append(module_name)
+        unchanged_modules = set()
+        for scheme, scheme_module_names in modules_by_scheme.items():
+            mode_algorithm = _scheme_mode_algorithm(scheme, self.checksum_algorithm)
+            if not mode_algorithm:
+                # unknown algorithm, the module is updated
+                continue
+            scheme_mode, scheme_algorithm = mode_algorithm
+            scheme_hashes = self.hash_modules(
+                scheme_module_names, scheme_mode, scheme_algorithm
+            )
+            unchanged_modules.update(
+                module_name
+                for module_name in scheme_module_names
+                if scheme_hashes[module_name][0] == checksums[module_name]
+            )
+        modules_to_update = [
+            module_name
+            for module_name in modules_to_update
+            if module_name not in unchanged_modules
+        ]
+        if explain:
+            # log which files changed since checksums were stored
+            _log_changed_files(self.cr, modules_to_update, hashes)
+        return modules_to_update
 
+    def needs_migration(self):
+        """Tell if some modules checked by modules_to_update have a checksum
+        stored with another scheme than the one computed, e.g. with another
+        algorithm, or by content for modules now clean in git mode."""
+        checksums = self._checked_checksums
+        return any(
+            checksum
+            and checksums.get(module_name)
+            and _parse_checksum(checksums[module_name])[0]
+            != _parse_checksum(checksum)[0]
+            for module_name, (checksum, _) in self.hashes.items()
+        )
 
-def _is_installable(module_name):
-    try:
-        if odoo.release.version_info < (16, 0):
-            manifest = odoo.modules.load_information_from_description_file(module_name)
+
+def _save_installed_checksums(
+    cr,
+    ignore_addons=None,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=None,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    checksums_snapshot=None,
+):
+    ChecksumSession(
+        cr,
+        hash_cache,
+        hash_jobs,
+        checksum_mode,
+        checksum_algorithm,
+        checksums_snapshot,
+    ).save(ignore_addons)
+
+
+def _get_modules_to_update(
+    cr,
+    ignore_addons=None,
+    hash_cache=None,
+    hash_jobs=None,
+    explain=False,
+    checksum_mode=None,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    checksums_snapshot=None,
+):
+    return ChecksumSession(
+        cr,
+        hash_cache,
+        hash_jobs,
+        checksum_mode,
+        checksum_algorithm,
+        checksums_snapshot,
+    ).modules_to_update(ignore_addons, explain)
+
+
+def _hash_addons(
+    module_names,
+    exclude_patterns,
+    keep_langs,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=None,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    checksums_snapshot=None,
+    with_trees=True,
+):
+    """Return a dictionary of module name to (checksum, file tree).
+
+    Modules are hashed concurrently by hash_jobs threads (default: the
+    number of CPUs). Modules not found in the addons path have a False
+    checksum and no file tree. Checksums are prefixed by their algorithm
+    and a colon, unless it is sha1.
+
+    In git checksum mode, the checksum of modules that are clean in git
+    is the id of their git tree, prefixed by git:, and they have no file
+    tree. Other modules are hashed as usual.
+
+    In semantic checksum mode, files are normalized before being hashed
+    (see _addon_hash.NORMALIZERS), and checksums are prefixed by
+    semantic-<algorithm> and a colon.
+
+    If a ChecksumsSnapshot computed with the same parameters is
+    provided, the checksums it contains are used without reading
+    modules; they have no file tree. Unless with_trees is set, file
+    trees are not computed.
+    """
+    addons_path = _get_addons_path()
+    module_paths = {}
+    for module_name in module_names:
+        module_path = addon_index.addon_dir(module_name, addons_path)
+        if module_path:
+            module_paths[module_name] = module_path
+    snapshot_hashes = {}
+    if checksums_snapshot is not None and checksums_snapshot.is_valid(
+        addons_path,
+        exclude_patterns,
+        keep_langs,
+        checksum_mode or CHECKSUM_MODE_CONTENT,
+        checksum_algorithm,
+    ):
+        for module_name, module_path in module_paths.items():
+            snapshot_hash = checksums_snapshot.get(module_name, module_path)
+            if snapshot_hash:
+                snapshot_hashes[module_name] = snapshot_hash
+    tree_ids = {}
+    if checksum_mode == CHECKSUM_MODE_GIT:
+        tree_ids = git_tree_ids(
+            [
+                module_path
+                for module_name, module_path in module_paths.items()
+                if module_name not in snapshot_hashes
+            ]
+        )
+
+    semantic = checksum_mode == CHECKSUM_MODE_SEMANTIC
+
+    def hash_module(module_name):
+        module_path = module_paths.get(module_name)
+        if module_name in snapshot_hashes:
+            return snapshot_hashes[module_name]
+        elif module_path in tree_ids:
+            return _format_checksum(GIT_CHECKSUM_SCHEME, tree_ids[module_path]), None
+        elif module_path:
+            digest, tree = addon_hash_tree(
+                module_path,
+                exclude_patterns,
+                keep_langs,
+                cache=hash_cache,
+                algorithm=checksum_algorithm,
+                semantic=semantic,
+                with_tree=with_trees,
+            )
+            if semantic:
+                scheme = SEMANTIC_CHECKSUM_SCHEME_PREFIX + checksum_algorithm
+            else:
+                scheme = checksum_algorithm
+            return _format_checksum(scheme, digest), tree
         else:
-            manifest = odoo.modules.get_manifest(module_name)
-        return manifest["installable"]
+            return False, None
+
+    with ThreadPoolExecutor(max_workers=hash_jobs or os.cpu_count()) as executor:
+        hashes = executor.map(hash_module, module_names)
+        return dict(zip(module_names, hashes))
+
+
+def _log_changed_files(cr, module_names, hashes):
+    trees = _load_installed_trees(cr, module_names)
+    for module_name in module_names:
+        old_tree = trees.get(module_name)
+        new_tree = hashes[module_name][1]
+        changes = []
+        if old_tree and new_tree:
+            changes = list(diff_trees(old_tree, new_tree))
+        if not changes:
+            _logger.info("%s: changed files unknown.", module_name)
+        for status, filepath in changes:
+            _logger.info("%s: %s %s", module_name, status, filepath)
+
+
+def _is_installable(module_name, addons_path=None):
+    addon_dir = addon_index.addon_dir(module_name, addons_path)
+    if not addon_dir:
+        return False
+    try:
+        manifest = addon_index.manifest(addon_dir)
     except Exception:
-        # load_information_from_description_file populates default value
-        # so the exception would be KeyError if the module does not exist
-        # in addons path, or an error parsing __manifest__.py. In either
-        # case the module will not be installable.
+        # the module will not be installable if its manifest can't be parsed
         return False
+    return manifest.get("installable", True)
+
+
+def _precompile_modules(module_names, addons_path=None):
+    """Compile the python files of modules to bytecode, in parallel.
+
+    Return the seconds the registry load would have spent compiling them.
+    """
+    addon_dirs = []
+    for module_name in module_names:
+        addon_dir = addon_index.addon_dir(module_name, addons_path)
+        if addon_dir:
+            addon_dirs.append(addon_dir)
+    files_count, compile_seconds, seconds = precompile_addons(
+        addon_dirs, include_tests=odoo.tools.config["test_enable"]
+    )
+    _logger.info(
+        "Precompiled %d python files of %d addons in %.2fs, instead of %.2fs "
+        "of compilation while loading the registry.",
+        files_count,
+        len(addon_dirs),
+        seconds,
+        compile_seconds,
+    )
+    return compile_seconds
 
 
 def _update_db_nolock(
@@ -223,32 +850,88 @@ def _update_db_nolock(
     watcher=None,
     list_only=False,
     ignore_addons=None,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=None,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    checksums_snapshot=None,
+    timings_report=None,
+    precompile=False,
+    plan=None,
+    record_durations=False,
 ):
+    def checksum_session(cr):
+        return ChecksumSession(
+            cr,
+            hash_cache,
+            hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+            checksums_snapshot,
+        )
+
+    session = None
     if update_all:
         modules_to_update = ["base"]
     else:
         with conn.cursor() as cr:
-            modules_to_update = _get_modules_to_update(cr, ignore_addons)
+            session = checksum_session(cr)
+            modules_to_update = session.modules_to_update(
+                ignore_addons, explain=list_only
+            )
         if modules_to_update:
             _logger.info(
                 "Updating addons for their hash changed: %s.",
                 ",".join(modules_to_update),
             )
+    if plan:
+        with conn.cursor() as cr:
+            update_plan = plan_update(cr, modules_to_update, update_all)
+        update_plan["database"] = database
+        json.dump(update_plan, plan, indent=2)
+        plan.write("\n")
+        _logger.info(
+            "Plan selected, update is not performed. Estimated duration: %.0fs.",
+            update_plan["estimated_seconds"],
+        )
+        return
     if list_only:
         _logger.info("List-only selected, update is not performed.")
         return
     if not modules_to_update:
         _logger.info("No module needs updating, update is not performed.")
+        if session.needs_migration():
+            with conn.cursor() as cr:
+                # store the checksums computed to find modules to update
+                checksum_session(cr).save(ignore_addons, previous_session=session)
         return
     if i18n_overwrite:
         odoo.tools.config["overwrite_existing_translations"] = True
-    if odoo.release.version_info >= (19, 0):
-        odoo.modules.registry.Registry.new(
-            database, update_module=True, upgrade_modules=modules_to_update
+    compile_seconds = None
+    if precompile:
+        with conn.cursor() as cr:
+            compile_seconds = _precompile_modules(
+                checksum_session(cr).module_names(
+                    ["installed", "to upgrade", "to install"]
+                )
+            )
+    start = perf_counter()
+    with record_module_timings(
+        timings_report, record_durations, command="update", database=database
+    ) as timings:
+        if odoo.release.version_info >= (19, 0):
+            odoo.modules.registry.Registry.new(
+                database, update_module=True, upgrade_modules=modules_to_update
+            )
+        else:
+            odoo.tools.config["update"] = dict.fromkeys(modules_to_update, 1)
+            odoo.modules.registry.Registry.new(database, update_module=True)
+    if compile_seconds is not None:
+        _logger.info(
+            "Registry loaded in %.2fs, precompilation saved about %.2fs.",
+            perf_counter() - start,
+            compile_seconds,
         )
-    else:
-        odoo.tools.config["update"] = dict.fromkeys(modules_to_update, 1)
-        odoo.modules.registry.Registry.new(database, update_module=True)
     if watcher and watcher.aborted:
         # If you get here, the updating session has been terminated and it
         # somehow has recovered by opening a new cursor and continuing;
@@ -257,7 +940,12 @@ def _update_db_nolock(
         # this script indicates always a failure
         raise click.Abort("Update aborted by watcher, check logs")
     with conn.cursor() as cr:
-        _save_installed_checksums(cr, ignore_addons)
+        # modules and languages may have changed, so use a new session,
+        # which reuses checksums computed before the update
+        checksum_session(cr).save(ignore_addons, previous_session=session)
+        if record_durations:
+            # for the estimations of --plan
+            save_module_durations(cr, timings.modules)
 
 
 def _update_db(
@@ -268,11 +956,45 @@ def _update_db(
     list_only=False,
     ignore_addons=None,
     only_compute_hashes=False,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=None,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    checksums_snapshot=None,
+    timings_report=None,
+    precompile=False,
+    plan=None,
+    record_durations=False,
 ):
     conn = odoo.sql_db.db_connect(database)
+    # hash addons before taking the lock, so processes updating the
+    # same database do not wait for it; under the lock, digests are
+    # found in the cache after checking file stats. Checksums are not
+    # compared when all modules are updated.
+    if hash_cache is not None and not update_all:
+        with conn.cursor() as cr:
+            session = ChecksumSession(
+                cr,
+                hash_cache,
+                hash_jobs,
+                checksum_mode,
+                checksum_algorithm,
+                checksums_snapshot,
+            )
+            session.hash_modules(
+                session.module_names(["installed", "to upgrade"], ignore_addons)
+            )
     with conn.cursor() as cr, advisory_lock(cr, "click-odoo-update/" + database):
         if only_compute_hashes:
-            _save_installed_checksums(cr, ignore_addons)
+            _save_installed_checksums(
+                cr,
+                ignore_addons,
+                hash_cache,
+                hash_jobs,
+                checksum_mode,
+                checksum_algorithm,
+                checksums_snapshot,
+            )
             _logger.info(
                 "Only computed and stored module hashes, update is not performed."
             )
@@ -286,9 +1008,254 @@ def _update_db(
             watcher,
             list_only,
             ignore_addons,
+            hash_cache,
+            hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+            checksums_snapshot,
+            timings_report,
+            precompile,
+            plan,
+            record_durations,
         )
 
 
+def _list_databases(databases_pattern):
+    """Return the sorted names of databases matching comma-separated
+    shell-style patterns."""
+    patterns = [p.strip() for p in databases_pattern.split(",") if p.strip()]
+    return sorted(
+        database
+        for database in odoo.service.db.list_dbs(True)
+        if any(fnmatch.fnmatchcase(database, pattern) for pattern in patterns)
+    )
+
+
+def _update_database_worker(args):
+    """Update one database of a fleet, in a process of the pool.
+
+    Return (database, error message or None).
+    """
+    (
+        database,
+        log_dir,
+        update_all,
+        i18n_overwrite,
+        watcher_max_seconds,
+        list_only,
+        ignore_addons,
+        only_compute_hashes,
+        cache_dir,
+        hash_jobs,
+        checksum_mode,
+        checksum_algorithm,
+        checksums_snapshot,
+        record_durations,
+    ) = args
+    threading.current_thread().dbname = database
+    if log_dir:
+        # this process only updates this database, so all its logs go there
+        root_logger = logging.getLogger()
+        handler = logging.FileHandler(os.path.join(log_dir, database + ".log"))
+        for root_handler in root_logger.handlers[:]:
+            handler.setFormatter(root_handler.formatter)
+            root_logger.removeHandler(root_handler)
+        root_logger.addHandler(handler)
+    watcher = None
+    if watcher_max_seconds > 0:
+        watcher = DbLockWatcher(database, watcher_max_seconds)
+        watcher.start()
+    hash_cache = HashCache(cache_dir)
+    try:
+        _update_db(
+            database,
+            update_all,
+            i18n_overwrite,
+            watcher,
+            list_only,
+            ignore_addons,
+            only_compute_hashes,
+            hash_cache,
+            hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+            checksums_snapshot,
+            record_durations=record_durations,
+        )
+    except Exception as e:
+        _logger.error("Update of database %s failed", database, exc_info=True)
+        return database, str(e) or e.__class__.__name__
+    finally:
+        if watcher:
+            watcher.stop()
+        hash_cache.save()
+    return database, None
+
+
+def _update_databases(
+    databases_pattern,
+    jobs=1,
+    log_dir=None,
+    update_all=False,
+    i18n_overwrite=False,
+    watcher_max_seconds=0,
+    list_only=False,
+    ignore_addons=None,
+    only_compute_hashes=False,
+    hash_cache=None,
+    hash_jobs=None,
+    checksum_mode=None,
+    checksum_algorithm=DEFAULT_ALGORITHM,
+    checksums_snapshot=None,
+    precompile=False,
+    record_durations=False,
+):
+    """Update the databases matching a pattern, with a pool of processes.
+
+    Addons are hashed once in this process, for each set of exclude
+    patterns and languages of the databases, and databases whose
+    checksums did not change are not updated. The others are updated by
+    processes of the pool, which get the checksums in a ChecksumsSnapshot.
+    Return a dictionary of database name to error message, for databases
+    whose update failed.
+
+    With precompile, the addons installed in the databases to update are
+    compiled to bytecode once, before updating them. With record_durations,
+    module durations are stored in each database, see --record-durations.
+    """
+    databases = _list_databases(databases_pattern)
+    if not databases:
+        _logger.warning("No database matches %s.", databases_pattern)
+        return {}
+    if hash_cache is None:
+        hash_cache = HashCache()
+    addons_path = _get_addons_path()
+    checksum_mode = checksum_mode or CHECKSUM_MODE_CONTENT
+    snapshots = {}  # checksum params -> checksums snapshot
+    databases_to_update = []
+    modules_to_load = set()
+    for database in databases:
+        with closing(odoo.sql_db.db_connect(database).cursor()) as cr:
+            session = ChecksumSession(
+                cr, hash_cache, hash_jobs, checksum_mode, checksum_algorithm
+            )
+            exclude_patterns, keep_langs = session.checksum_params
+            params_key = json.dumps([exclude_patterns, sorted(keep_langs)])
+            snapshot = snapshots.get(params_key)
+            if snapshot is None:
+                # checksums of modules installed in the databases with
+                # these parameters, so they are hashed once
+                snapshot = snapshots[params_key] = ChecksumsSnapshot.create(
+                    addons_path,
+                    exclude_patterns,
+                    keep_langs,
+                    checksum_mode,
+                    checksum_algorithm,
+                    {},
+                    {},
+                )
+                if checksums_snapshot is not None and checksums_snapshot.is_valid(
+                    addons_path,
+                    exclude_patterns,
+                    keep_langs,
+                    checksum_mode,
+                    checksum_algorithm,
+                ):
+                    snapshot.data["modules"].update(checksums_snapshot.data["modules"])
+            session.checksums_snapshot = snapshot
+            if update_all or only_compute_hashes:
+                session.hash_modules(
+                    session.module_names(["installed", "to upgrade"], ignore_addons)
+                )
+                needs_update = True
+            else:
+                modules_to_update = session.modules_to_update(
+                    ignore_addons, explain=list_only
+                )
+                if modules_to_update:
+                    _logger.info(
+                        "%s: addons to update: %s.",
+                        database,
+                        ",".join(modules_to_update),
+                    )
+                needs_update = bool(modules_to_update) or session.needs_migration()
+            if needs_update and precompile and not list_only:
+                modules_to_load.update(
+                    session.module_names(["installed", "to upgrade", "to install"])
+                )
+        new_hashes = {
+            module_name: module_hash
+            for module_name, module_hash in session.hashes.items()
+            if module_hash[0]
+        }
+        snapshot.update_modules(
+            {
+                module_name: addon_index.addon_dir(module_name, addons_path)
+                for module_name in new_hashes
+            },
+            new_hashes,
+        )
+        if list_only:
+            continue
+        if needs_update:
+            databases_to_update.append((database, snapshot))
+        else:
+            _logger.info("%s: no module needs updating.", database)
+    hash_cache.save()
+    if not databases_to_update:
+        return {}
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    if precompile and not only_compute_hashes:
+        # once for all databases, before forking processes that load them
+        _precompile_modules(modules_to_load, addons_path)
+    # connections must not be shared with forked processes
+    odoo.sql_db.close_all()
+    _logger.info(
+        "Updating %d databases with %d processes: %s.",
+        len(databases_to_update),
+        jobs,
+        ",".join(database for database, _ in databases_to_update),
+    )
+    tasks = [
+        (
+            database,
+            log_dir,
+            update_all,
+            i18n_overwrite,
+            watcher_max_seconds,
+            list_only,
+            ignore_addons,
+            only_compute_hashes,
+            hash_cache.cache_dir,
+            hash_jobs,
+            checksum_mode,
+            checksum_algorithm,
+            checksums_snapshot,
+            record_durations,
+        )
+        for database, checksums_snapshot in databases_to_update
+    ]
+    errors = {}
+    # one process per database, so registries and Odoo globals are not
+    # shared between databases
+    pool = multiprocessing.get_context("fork").Pool(jobs, maxtasksperchild=1)
+    try:
+        for database, error in pool.imap_unordered(_update_database_worker, tasks):
+            if error:
+                _logger.error("%s: update failed: %s", database, error)
+                errors[database] = error
+            else:
+                _logger.info("%s: updated.", database)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return errors
+
+
 def _get_ignore_addons(ignore_addons_str=None, ignore_core_addons=None):
     ignore_addons = set()
     if ignore_addons_str:
@@ -298,21 +1265,54 @@ def _get_ignore_addons(ignore_addons_str=None, ignore_core_addons=None):
     return ignore_addons
 
 
+def _get_update_ignore_addons(params):
+    ignore_addons = _get_ignore_addons(
+        params["ignore_addons"], params["ignore_core_addons"]
+    )
+    if ignore_addons and params["update_all"]:
+        raise click.ClickException(
+            "--update-all and --ignore(-core)-addons cannot be used together"
+        )
+    return ignore_addons
+
+
+def _get_hash_cache(params):
+    # without the on-disk cache, digests are still cached in memory
+    cache_dir = default_cache_dir() if params["hash_cache"] else None
+    addon_index.cache_dir = cache_dir
+    return HashCache(cache_dir)
+
+
+def _load_checksums_snapshot(path):
+    if not path:
+        return None
+    try:
+        return ChecksumsSnapshot.load(path)
+    except (OSError, ValueError):
+        _logger.warning(
+            "Could not read checksums snapshot %s, addons are hashed.",
+            path,
+            exc_info=True,
+        )
+        return None
+
+
 @contextmanager
 def OdooEnvironmentWithUpdate(database, ctx, **kwargs):
     threading.current_thread().dbname = database
+    if ctx.params["databases"]:
+        raise click.ClickException(
+            "--databases cannot be used with a database name, given with -d "
+            "or in the Odoo configuration file"
+        )
+    ignore_addons = _get_update_ignore_addons(ctx.params)
+    hash_cache = _get_hash_cache(ctx.params)
+    checksums_snapshot = _load_checksums_snapshot(ctx.params["checksums_snapshot"])
     # Watch for database locks while Odoo updates
     watcher = None
     if ctx.params["watcher_max_seconds"] > 0:
         watcher = DbLockWatcher(database, ctx.params["watcher_max_seconds"])
         watcher.start()
-    ignore_addons = _get_ignore_addons(
-        ctx.params["ignore_addons"], ctx.params["ignore_core_addons"]
-    )
-    if ignore_addons and ctx.params["update_all"]:
-        raise click.ClickException(
-            "--update-all and --ignore(-core)-addons cannot be used together"
-        )
     # Update Odoo datatabase
     try:
         _update_db(
@@ -323,10 +1323,21 @@ def OdooEnvironmentWithUpdate(database, ctx, **kwargs):
             ctx.params["list_only"],
             ignore_addons,
             ctx.params["only_compute_hashes"],
+            hash_cache,
+            ctx.params["hash_jobs"],
+            ctx.params["checksum_mode"],
+            ctx.params["checksum_algorithm"],
+            checksums_snapshot,
+            ctx.params["timings_report"],
+            ctx.params["precompile"],
+            ctx.params["plan"],
+            ctx.params["record_durations"],
         )
     finally:
         if watcher:
             watcher.stop()
+        hash_cache.save()
+        addon_index.save()
     # If we get here, the database has been updated
     with OdooEnvironment(database) as env:
         yield env
@@ -335,6 +1346,7 @@ def OdooEnvironmentWithUpdate(database, ctx, **kwargs):
 @click.command()
 @click_odoo.env_options(
     with_rollback=False,
+    database_required=False,
     database_must_exist=False,
     with_addons_path=True,
     environment_manager=OdooEnvironmentWithUpdate,
@@ -372,7 +1384,10 @@ def OdooEnvironmentWithUpdate(database, ctx, **kwargs):
 @click.option(
     "--list-only",
     is_flag=True,
-    help="Log the list of addons to update without actually updating them.",
+    help=(
+        "Log the list of addons to update, and the files that changed in each "
+        "of them, without actually updating them."
+    ),
 )
 @click.option(
     "--only-compute-hashes",
@@ -383,6 +1398,130 @@ def OdooEnvironmentWithUpdate(database, ctx, **kwargs):
         "and you don't want to run `click-odoo-update --update-all`."
     ),
 )
+@click.option(
+    "--hash-cache/--no-hash-cache",
+    default=True,
+    show_default=True,
+    help=(
+        "Cache addon checksums and manifests on disk, so addons whose files "
+        "have the same size, modification and change times and inode are not "
+        "read again. The cache is stored in $CLICK_ODOO_CONTRIB_CACHE_DIR, or "
+        "in click-odoo-contrib under $XDG_CACHE_HOME (~/.cache by default)."
+    ),
+)
+@click.option(
+    "--hash-jobs",
+    type=click.IntRange(min=1),
+    help="Number of threads used to compute addon checksums. "
+    "Default: the number of CPUs.",
+)
+@click.option(
+    "--checksum-mode",
+    type=click.Choice(CHECKSUM_MODES),
+    default=CHECKSUM_MODE_CONTENT,
+    show_default=True,
+    help=(
+        "How addon checksums are computed. With git, the checksum of addons "
+        "without uncommitted changes nor untracked files is the id of their "
+        "git tree, so their files are not read. Note that this checksum covers "
+        "all files tracked by git, including those matching exclude patterns. "
+        "With semantic, python, xml and csv files and manifests are normalized "
+        "before being hashed, so changing their formatting or comments does not "
+        "update addons; python files are compared by their syntax tree, which "
+        "may change with the python version."
+    ),
+)
+@click.option(
+    "--checksum-algorithm",
+    type=click.Choice(sorted(ALGORITHMS)),
+    default=DEFAULT_ALGORITHM,
+    show_default=True,
+    help=(
+        "Hash algorithm for addon checksums. xxh3_128 is available when the "
+        "xxhash library is installed. Checksums stored with another algorithm "
+        "are migrated without updating the addons that did not change."
+    ),
+)
+@click.option(
+    "--checksums-snapshot",
+    type=click.Path(dir_okay=False),
+    help=(
+        "Use addon checksums computed in advance by click-odoo-checksums, "
+        "for instance when building a container image, instead of reading "
+        "addons. The snapshot is ignored if it is missing, if it was computed "
+        "with another addons path, exclude patterns, languages, checksum mode "
+        "or algorithm, or if its watcher is not running. Addons missing from "
+        "the snapshot or found elsewhere are hashed."
+    ),
+)
+@click.option(
+    "--databases",
+    metavar="PATTERNS",
+    help=(
+        "Update all databases matching these comma-separated shell-style "
+        "patterns (e.g. 'tenant_*'), instead of the one given with -d. Addons "
+        "are hashed once, databases whose addons did not change are not "
+        "updated, and the others are updated in parallel by separate "
+        "processes. The command fails if the update of any database fails."
+    ),
+)
+@click.option(
+    "--databases-jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="With --databases, number of databases updated in parallel.",
+)
+@click.option(
+    "--databases-log-dir",
+    type=click.Path(file_okay=False),
+    help=(
+        "With --databases, write the logs of the update of each database in "
+        "<database>.log in this directory, instead of the standard error."
+    ),
+)
+@click.option(
+    "--precompile",
+    is_flag=True,
+    help=(
+        "Before updating, compile the python files of installed addons to "
+        "bytecode in parallel, with one process per CPU, instead of one file "
+        "at a time while loading the registry. This speeds up the first update "
+        "of freshly deployed addons. If addons directories are read-only, "
+        "bytecode is written in the cache directory (Python >= 3.8)."
+    ),
+)
+@click.option(
+    "--record-durations",
+    is_flag=True,
+    help=(
+        "Store in the database the duration of each module loaded, installed "
+        "or upgraded during the update, for the estimations of --plan. The last "
+        "10 durations of each module are kept."
+    ),
+)
+@click.option(
+    "--plan",
+    type=click.File("w"),
+    help=(
+        "Write to this file ('-' for the standard output) a JSON plan of the "
+        "update, instead of performing it: the addons to update and the "
+        "installed addons depending on them, which Odoo upgrades with them, "
+        "and an estimation of the duration of the update and of its critical "
+        "path, from the durations of each addon stored in the database by "
+        "previous updates run with --record-durations."
+    ),
+)
+@click.option(
+    "--timings-report",
+    type=click.Path(dir_okay=False),
+    help=(
+        "Write to this file a JSON report of the time, SQL queries and memory "
+        "spent loading, installing or upgrading each module during the update. "
+        "The python memory delta is only recorded when tracemalloc is enabled "
+        "(PYTHONTRACEMALLOC=1), which slows down the update."
+    ),
+)
 def main(
     env,
     i18n_overwrite,
@@ -393,6 +1532,18 @@ def main(
     ignore_addons,
     ignore_core_addons,
     only_compute_hashes,
+    hash_cache,
+    hash_jobs,
+    checksum_mode,
+    checksum_algorithm,
+    checksums_snapshot,
+    databases,
+    databases_jobs,
+    databases_log_dir,
+    timings_report,
+    precompile,
+    plan,
+    record_durations,
 ):
     """Update an Odoo database (odoo -u), automatically detecting
     addons to update based on a hash of their file content, compared
@@ -406,7 +1557,52 @@ def main(
     swap them ASAP once the update is done. This process will reduce downtime
     a lot, but it requires deeper knowledge of Odoo internals to be used
     safely, so use it at your own risk.
+
+    With --databases, all databases matching patterns are updated, which
+    is faster than running click-odoo-update for each of them.
     """
+    if databases:
+        if timings_report or plan:
+            raise click.ClickException(
+                "--timings-report and --plan cannot be used with --databases"
+            )
+        params = click.get_current_context().params
+        ignore_addons = _get_update_ignore_addons(params)
+        hash_cache = _get_hash_cache(params)
+        try:
+            errors = _update_databases(
+                databases,
+                databases_jobs,
+                databases_log_dir,
+                update_all,
+                i18n_overwrite,
+                watcher_max_seconds,
+                list_only,
+                ignore_addons,
+                only_compute_hashes,
+                hash_cache,
+                hash_jobs,
+                checksum_mode,
+                checksum_algorithm,
+                _load_checksums_snapshot(checksums_snapshot),
+                precompile,
+                record_durations,
+            )
+        finally:
+            hash_cache.save()
+            addon_index.save()
+        if errors:
+            raise click.ClickException(
+                "Update failed for {} database(s): {}".format(
+                    len(errors), ",".join(sorted(errors))
+                )
+            )
+        return
+    if not odoo.tools.config["db_name"]:
+        raise click.UsageError(
+            "No database provided, please provide one with the -d option, "
+            "the Odoo configuration file, or use --databases."
+        )
     if not env:
         msg = "Database does not exist"
         if if_exists:
@@ -0,0 +1,3 @@
+Addons directories and manifests are read once per process in an addon
+index shared by ``click-odoo-update``, ``click-odoo-initdb`` and
+``click-odoo-checksums``, instead of once per lookup.
@@ -0,0 +1,3 @@
+``expand_dependencies`` resolves auto_install modules in linear time, which
+speeds up ``click-odoo-initdb`` on addons paths with many auto_install
+modules.
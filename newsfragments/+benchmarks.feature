@@ -0,0 +1,3 @@
+Add benchmarks of addon hashing and dependency expansion on synthetic addons
+trees, reporting wall time, syscalls and peak memory
+(``tests/test_benchmark.py``).
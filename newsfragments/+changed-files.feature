@@ -0,0 +1,2 @@
+click-odoo-update: store a tree of file checksums next to addon checksums, so
+``--list-only`` reports which files changed in each addon to update.
@@ -0,0 +1,3 @@
+click-odoo-update, click-odoo-initdb: add ``--checksum-algorithm``, to hash addons
+with blake2b, or xxh3_128 when xxhash is installed, instead of sha1. Stored
+checksums record their algorithm, and are migrated without updating addons.
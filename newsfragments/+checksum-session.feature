@@ -0,0 +1,2 @@
+click-odoo-update: load the checksum configuration of the database once per
+run phase, and store checksums and file trees with a single SQL statement.
@@ -0,0 +1,9 @@
+``click-odoo-update`` stores addon checksums in a ``click_odoo_module_checksum``
+table, with one row per module, instead of a single system parameter. Only
+the checksums of changed modules are written, and only those of the modules
+being checked are read. Checksums stored in system parameters are migrated
+the first time checksums are saved, and the
+``module_auto_update.installed_checksums`` parameter is kept up to date for
+the ``module_auto_update`` addon and previous versions: changed checksums
+are merged in it, without reading the table, though being a single value it
+is rewritten as a whole.
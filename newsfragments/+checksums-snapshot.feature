@@ -0,0 +1,4 @@
+New ``click-odoo-checksums`` script, computing addon checksums into a snapshot
+file when addons are deployed (e.g. in a container image build), and
+click-odoo-update ``--checksums-snapshot`` option to use it instead of reading
+addons at update time.
@@ -0,0 +1,4 @@
+click-odoo-checksums: add ``--watch``, to keep the checksums snapshot up to
+date with inotify (``inotify`` extra) as addons change, so repeated
+click-odoo-update runs only rehash changed addons. click-odoo-update ignores a
+missing snapshot, or one whose watcher is not running.
@@ -0,0 +1,2 @@
+Add ``manifest.DependencyGraph``, giving reverse dependencies, topological
+levels, dependency cycles and subset/superset queries of the addons path.
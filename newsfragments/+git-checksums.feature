@@ -0,0 +1,2 @@
+click-odoo-update, click-odoo-initdb: add ``--checksum-mode git``, to use the git
+tree id of addons that are clean in git instead of reading their files.
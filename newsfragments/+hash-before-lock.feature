@@ -0,0 +1,3 @@
+click-odoo-update: hash addons before taking the database advisory lock, and
+only check their file stats under the lock, so concurrent updates of the same
+database wait for less time.
@@ -0,0 +1,3 @@
+click-odoo-update: cache addon checksums on disk, keyed by file size, mtime,
+ctime and inode, so addons that did not change are not read again
+(``--no-hash-cache`` to disable).
@@ -0,0 +1,2 @@
+click-odoo-update: compute addon checksums concurrently, with ``--hash-jobs``
+threads (the number of CPUs by default).
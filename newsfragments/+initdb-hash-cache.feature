@@ -0,0 +1,5 @@
+click-odoo-initdb: compute template hashsums from per-module checksums, with
+the same hashing code and on-disk cache as click-odoo-update, so unchanged
+addons are not read again; add ``--hash-cache/--no-hash-cache`` and
+``--hash-jobs``. Existing cached templates are not matched anymore and will be
+recreated once.
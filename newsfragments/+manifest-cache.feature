@@ -0,0 +1,3 @@
+With ``--hash-cache`` (the default), ``click-odoo-initdb`` and
+``click-odoo-update`` keep parsed manifests on disk, and only parse again
+manifests whose size or modification time changed.
@@ -0,0 +1,3 @@
+Addons directories are probed and manifests parsed by a thread pool, which
+speeds up ``find_addons`` (used by ``click-odoo-makepot``) and dependency
+expansion on network file systems or cold disk caches.
@@ -0,0 +1,4 @@
+``click-odoo-update --precompile`` compiles the python files of installed
+addons to bytecode in parallel before loading the registry, writing bytecode
+in the cache directory when addons are read-only, and logs the compilation
+time saved on the registry load.
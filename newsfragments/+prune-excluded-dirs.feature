@@ -0,0 +1,2 @@
+click-odoo-update, click-odoo-initdb: do not list directories whose content is
+entirely excluded from addon checksums (such as ``static/``).
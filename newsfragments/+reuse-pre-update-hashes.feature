@@ -0,0 +1,3 @@
+After an update, ``click-odoo-update`` stores the checksums it computed
+before the update instead of hashing all installed modules again; only
+modules installed by the update are hashed.
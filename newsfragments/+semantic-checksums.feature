@@ -0,0 +1,5 @@
+click-odoo-update, click-odoo-initdb, click-odoo-checksums: add a ``semantic``
+checksum mode, where python, xml and csv files and manifests are normalized
+before being hashed, so reformatting addons does not update them. Semantic
+checksums are stored with a ``semantic-<algorithm>:`` prefix, and switching
+mode does not update addons that did not change.
@@ -0,0 +1,3 @@
+``click-odoo-update`` and ``click-odoo-initdb`` accept ``--timings-report``
+to write a JSON report of the time, SQL queries and memory spent on each
+module loaded, installed or upgraded.
@@ -0,0 +1,4 @@
+``click-odoo-update --databases PATTERNS`` updates all matching databases:
+addons are hashed once, and databases that need it are updated in parallel
+(``--databases-jobs``) by separate processes, with optional per-database
+logs (``--databases-log-dir``). The command fails if any update fails.
@@ -0,0 +1,4 @@
+``click-odoo-update --record-durations`` stores the duration of each module
+loaded or upgraded in the database, and ``--plan`` writes a JSON plan of the
+update instead of performing it: the addons to upgrade with their reverse
+dependencies, the estimated duration of the update and its critical path.
@@ -25,6 +25,10 @@ setup(
         "manifestoo-core>=0.7",
         "importlib_resources ; python_version<'3.9'",
     ],
+    extras_require={
+        "xxhash": ["xxhash>=2.0"],
+        "inotify": ["inotify_simple>=1.3"],
+    },
     python_requires=">=3.6",
     license="LGPLv3+",
     author="ACSONE SA/NV",
@@ -54,5 +58,6 @@ setup(
         click-odoo-backupdb=click_odoo_contrib.backupdb:main
         click-odoo-restoredb=click_odoo_contrib.restoredb:main
         click-odoo-makepot=click_odoo_contrib.makepot:main
+        click-odoo-checksums=click_odoo_contrib.checksums:main
     """,
 )
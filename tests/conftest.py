@@ -13,6 +13,9 @@ from click_odoo import odoo, odoo_bin
 # mechanism. Logging is therefore tested with subprocesses.
 odoo.netsvc.init_logger = lambda: None
 
+# lines added by tests to the terminal summary, see the summary_lines fixture
+_summary_lines = []
+
 
 def _init_odoo_db(dbname, test_addons_dir=None):
     subprocess.check_call(["createdb", dbname])
@@ -63,3 +66,17 @@ def odoocfg(request, tmpdir):
         )
     )
     yield odoo_cfg
+
+
+@pytest.fixture(scope="session")
+def summary_lines():
+    """List of lines to write in the terminal summary, e.g. benchmark
+    results, which are shown even when output is captured."""
+    return _summary_lines
+
+
+def pytest_terminal_summary(terminalreporter):
+    if _summary_lines:
+        terminalreporter.write_sep("=", "summary")
+        for line in _summary_lines:
+            terminalreporter.write_line(line)
@@ -1,7 +1,13 @@
 # Copyright 2018 ACSONE SA/NV.
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl).
 
+import hashlib
 import os
+import shutil
+import time
+import tracemalloc
+
+import pytest
 
 from click_odoo_contrib import _addon_hash
 from click_odoo_contrib.update import DEFAULT_EXCLUDE_PATTERNS
@@ -54,6 +60,43 @@ def test_exclude():
     ]
 
 
+def test_exclude_prune(monkeypatch):
+    scanned = []
+    scandir = os.scandir
+
+    def _scandir(path):
+        scanned.append(os.path.relpath(path, sample_dir))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", _scandir)
+    files = list(
+        _addon_hash._walk(
+            sample_dir,
+            exclude_patterns=DEFAULT_EXCLUDE_PATTERNS.split(","),
+            keep_langs=[],
+        )
+    )
+    assert "static/src/some.js" not in files
+    assert "static" not in scanned
+    assert "static/src" not in scanned
+    assert "models" in scanned
+
+
+def test_exclude_patterns():
+    exclude_patterns = _addon_hash.ExcludePatterns(
+        ["*.pyc", "static/*", "*/__pycache__/*", "i18n/*.pot"]
+    )
+    assert exclude_patterns.match("models/stuff.pyc")
+    assert exclude_patterns.match("static/src/some.js")
+    assert not exclude_patterns.match("models/stuff.py")
+    assert exclude_patterns.match_dir("static")
+    assert exclude_patterns.match_dir("static/src")
+    assert exclude_patterns.match_dir("models/__pycache__")
+    assert not exclude_patterns.match_dir("models")
+    assert not exclude_patterns.match_dir("i18n")
+    assert not exclude_patterns.match_dir("src/static")
+
+
 def test2():
     checksum = _addon_hash.addon_hash(
         sample_dir,
@@ -61,3 +104,251 @@ def test2():
         keep_langs=["fr_FR", "nl"],
     )
     assert checksum == "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+
+
+def test_algorithm():
+    exclude_patterns = ["*.pyc", "*.pyo", "*.pot", "static/*"]
+    checksum = _addon_hash.addon_hash(
+        sample_dir, exclude_patterns, keep_langs=["fr_FR", "nl"], algorithm="sha1"
+    )
+    assert checksum == "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+    checksum = _addon_hash.addon_hash(
+        sample_dir, exclude_patterns, keep_langs=["fr_FR", "nl"], algorithm="blake2b"
+    )
+    assert checksum != "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+    assert len(checksum) == 40
+    # the cache does not mix algorithms
+    cache = _addon_hash.HashCache()
+    for algorithm in ("sha1", "blake2b"):
+        cached_checksum = _addon_hash.addon_hash(
+            sample_dir, exclude_patterns, ["fr_FR", "nl"], cache, algorithm
+        )
+        assert cached_checksum == _addon_hash.addon_hash(
+            sample_dir, exclude_patterns, ["fr_FR", "nl"], algorithm=algorithm
+        )
+
+
+def _copy_sample(tmp_path):
+    top = tmp_path / "addons" / "test_addon_hash"
+    shutil.copytree(sample_dir, str(top))
+    # make sure files are not considered as possibly racily modified
+    old = time.time() - 3600
+    for dirpath, _, filenames in os.walk(str(top)):
+        for filename in filenames:
+            os.utime(os.path.join(dirpath, filename), (old, old))
+    return str(top)
+
+
+def _tamper(filepath):
+    # change the content of a file, keeping its size and mtime
+    st = os.stat(filepath)
+    with open(filepath, "rb") as f:
+        content = f.read()
+    with open(filepath, "wb") as f:
+        f.write(bytes([content[0] ^ 1]) + content[1:])
+    os.utime(filepath, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def test_cache(tmp_path, monkeypatch):
+    top = _copy_sample(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    exclude_patterns = ["*.pyc", "*.pyo", "*.pot", "static/*"]
+    cache = _addon_hash.HashCache(cache_dir)
+    checksum = _addon_hash.addon_hash(
+        top, exclude_patterns, keep_langs=["fr_FR", "nl"], cache=cache
+    )
+    assert checksum == "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+    cache.save()
+    assert len(os.listdir(cache_dir)) == 1
+    # file stat did not change, so files are not read again
+    monkeypatch.setattr(_addon_hash, "hash_file", None)
+    cache = _addon_hash.HashCache(cache_dir)
+    checksum = _addon_hash.addon_hash(
+        top, exclude_patterns, keep_langs=["fr_FR", "nl"], cache=cache
+    )
+    assert checksum == "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+    monkeypatch.undo()
+    # a change keeping the size and mtime (cp -p) is found by the ctime
+    _tamper(os.path.join(top, "README.rst"))
+    checksum = _addon_hash.addon_hash(
+        top, exclude_patterns, keep_langs=["fr_FR", "nl"], cache=cache
+    )
+    assert checksum == _addon_hash.addon_hash(top, exclude_patterns, ["fr_FR", "nl"])
+    assert checksum != "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+    # different languages invalidate the cache
+    checksum = _addon_hash.addon_hash(
+        top, exclude_patterns, keep_langs=["fr"], cache=cache
+    )
+    assert checksum == _addon_hash.addon_hash(top, exclude_patterns, ["fr"])
+    # so do different exclude patterns
+    checksum = _addon_hash.addon_hash(
+        top, exclude_patterns[:-1], keep_langs=["fr_FR", "nl"], cache=cache
+    )
+    assert checksum == _addon_hash.addon_hash(
+        top, exclude_patterns[:-1], ["fr_FR", "nl"]
+    )
+    # touching the file invalidates the cache
+    os.utime(os.path.join(top, "README.rst"))
+    checksum = _addon_hash.addon_hash(
+        top, exclude_patterns, keep_langs=["fr_FR", "nl"], cache=cache
+    )
+    assert checksum != "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+
+
+def test_cache_racy(tmp_path):
+    top = _copy_sample(tmp_path)
+    os.utime(os.path.join(top, "README.rst"))
+    cache = _addon_hash.HashCache()
+    _addon_hash.addon_hash(top, ["static/*"], keep_langs=[], cache=cache)
+    # README.rst has just been modified so the digest has not been cached
+    _tamper(os.path.join(top, "README.rst"))
+    checksum = _addon_hash.addon_hash(top, ["static/*"], keep_langs=[], cache=cache)
+    assert checksum == _addon_hash.addon_hash(top, ["static/*"], keep_langs=[])
+
+
+def test_tree(tmp_path):
+    top = _copy_sample(tmp_path)
+    exclude_patterns = ["*.pyc", "*.pyo", "*.pot", "static/*"]
+    checksum, tree = _addon_hash.addon_hash_tree(
+        top, exclude_patterns, keep_langs=["fr_FR", "nl"]
+    )
+    assert checksum == "fecb89486c8a29d1f760cbd01c1950f6e8421b14"
+    assert sorted(tree[1]) == ["README.rst", "data", "i18n", "i18n_extra", "models"]
+    assert list(_addon_hash.diff_trees(tree, tree)) == []
+    with open(os.path.join(top, "data", "f1.xml"), "a") as f:
+        f.write("<!-- changed -->")
+    os.remove(os.path.join(top, "README.rst"))
+    os.remove(os.path.join(top, "models", "stuff.py"))
+    os.mkdir(os.path.join(top, "views"))
+    with open(os.path.join(top, "views", "v.xml"), "w") as f:
+        f.write("<odoo/>")
+    _, new_tree = _addon_hash.addon_hash_tree(
+        top, exclude_patterns, keep_langs=["fr_FR", "nl"]
+    )
+    # unchanged subtrees keep their digest
+    assert new_tree[1]["i18n"] == tree[1]["i18n"]
+    assert new_tree[1]["data"][0] != tree[1]["data"][0]
+    assert list(_addon_hash.diff_trees(tree, new_tree)) == [
+        ("removed", "README.rst"),
+        ("modified", "data/f1.xml"),
+        ("removed", "models/stuff.py"),
+        ("added", "views/v.xml"),
+    ]
+
+
+def test_tree_cache(tmp_path, monkeypatch):
+    top = _copy_sample(tmp_path)
+    exclude_patterns = ["*.pyc", "*.pyo", "*.pot", "static/*"]
+    cache = _addon_hash.HashCache()
+    _addon_hash.addon_hash_tree(top, exclude_patterns, ["fr_FR", "nl"], cache)
+    with open(os.path.join(top, "data", "f1.xml"), "a") as f:
+        f.write("<!-- changed -->")
+    hashed_twice = []
+    hash_file = _addon_hash.hash_file
+
+    def _hash_file(path, *hash_objects):
+        if len(hash_objects) > 1:
+            hashed_twice.append(os.path.relpath(path, top))
+        return hash_file(path, *hash_objects)
+
+    monkeypatch.setattr(_addon_hash, "hash_file", _hash_file)
+    checksum, tree = _addon_hash.addon_hash_tree(
+        top, exclude_patterns, ["fr_FR", "nl"], cache
+    )
+    # digests of files in unchanged directories are taken from the cache
+    assert hashed_twice == [
+        os.path.join("data", "f1.xml"),
+        os.path.join("data", "f2.xml"),
+    ]
+    assert (checksum, tree) == _addon_hash.addon_hash_tree(
+        top, exclude_patterns, ["fr_FR", "nl"]
+    )
+    # files are hashed once when the tree is not needed
+    hashed_twice.clear()
+    assert checksum == _addon_hash.addon_hash(top, exclude_patterns, ["fr_FR", "nl"])
+    assert not hashed_twice
+
+
+@pytest.mark.parametrize("size_mb", [1, 64])
+def test_memory(tmp_path, size_mb):
+    # peak memory while hashing does not depend on file size
+    top = tmp_path / "addon"
+    top.mkdir()
+    with open(str(top / "data.csv"), "wb") as f:
+        f.truncate(size_mb * 1024 * 1024)
+    tracemalloc.start()
+    try:
+        checksum = _addon_hash.addon_hash(str(top), [], [])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    m = hashlib.sha1(b"data.csv")
+    m.update(b"\0" * size_mb * 1024 * 1024)
+    assert checksum == m.hexdigest()
+    assert peak < 2 * _addon_hash.BUFFER_SIZE
+
+
+def _write(filepath, content):
+    with open(filepath, "w") as f:
+        f.write(content)
+
+
+def test_semantic(tmp_path):
+    top = _copy_sample(tmp_path)
+    exclude_patterns = ["*.pyc", "*.pyo", "*.pot", "static/*"]
+
+    def _semantic_hash():
+        return _addon_hash.addon_hash(top, exclude_patterns, [], semantic=True)
+
+    _write(os.path.join(top, "__manifest__.py"), '{"name": "A", "depends": ["b"]}')
+    _write(os.path.join(top, "models", "stuff.py"), "a = 1\n")
+    _write(os.path.join(top, "data", "f1.xml"), '<odoo><r a="1" b="2">t</r></odoo>')
+    _write(os.path.join(top, "data", "f2.csv"), "id,name\nx,y\n")
+    checksum = _semantic_hash()
+    assert checksum != _addon_hash.addon_hash(top, exclude_patterns, [])
+    # formatting and comments do not change semantic checksums
+    _write(
+        os.path.join(top, "__manifest__.py"),
+        "# comment\n{\n    'depends': ['b'],\n    'name': 'A',\n}\n",
+    )
+    _write(os.path.join(top, "models", "stuff.py"), "# comment\na  =  (1)\n")
+    _write(
+        os.path.join(top, "data", "f1.xml"),
+        '<?xml version="1.0"?>\n<odoo>\n  <!-- comment -->\n'
+        '  <r b="2" a="1">\n    t\n  </r>\n</odoo>\n',
+    )
+    _write(os.path.join(top, "data", "f2.csv"), '"id","name"\r\n"x","y"\r\n')
+    assert _semantic_hash() == checksum
+    # the cache does not mix semantic and content digests
+    cache = _addon_hash.HashCache()
+    assert _addon_hash.addon_hash(top, exclude_patterns, [], cache) != checksum
+    assert (
+        _addon_hash.addon_hash(top, exclude_patterns, [], cache, semantic=True)
+        == checksum
+    )
+    # other changes do
+    _write(os.path.join(top, "models", "stuff.py"), "a = 2\n")
+    assert _semantic_hash() != checksum
+    _write(os.path.join(top, "models", "stuff.py"), "a = 1\n")
+    _write(os.path.join(top, "data", "f1.xml"), '<odoo><r a="1" b="3">t</r></odoo>')
+    assert _semantic_hash() != checksum
+    # invalid files are hashed as is
+    _write(os.path.join(top, "data", "f1.xml"), "<odoo>")
+    checksum = _semantic_hash()
+    _write(os.path.join(top, "data", "f1.xml"), "<odoo> ")
+    assert _semantic_hash() != checksum
+
+
+def test_semantic_large_file(tmp_path, monkeypatch):
+    top = _copy_sample(tmp_path)
+    exclude_patterns = ["*.pyc", "*.pyo", "*.pot", "static/*"]
+    content = '<odoo><r a="1">t</r></odoo>'
+
+    def _semantic_hash(content):
+        _write(os.path.join(top, "data", "f1.xml"), content)
+        return _addon_hash.addon_hash(top, exclude_patterns, [], semantic=True)
+
+    assert _semantic_hash(content) == _semantic_hash(content + " ")
+    # files too large to be normalized are hashed as is
+    monkeypatch.setattr(_addon_hash, "NORMALIZE_MAX_SIZE", len(content) - 1)
+    assert _semantic_hash(content) != _semantic_hash(content + " ")
@@ -0,0 +1,325 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+"""Benchmarks of addon hashing and dependency expansion.
+
+They run on synthetic addons trees and need no database. The size of
+the trees is multiplied by $CLICK_ODOO_CONTRIB_BENCHMARK_SCALE (default
+0.1, so they stay quick in the test suite); use 1 or more for
+meaningful figures, e.g.:
+
+    CLICK_ODOO_CONTRIB_BENCHMARK_SCALE=1 pytest tests/test_benchmark.py
+
+Wall time, read/write syscalls (from /proc/self/io, Linux only), files
+and directories opened (Python >= 3.8) and peak python memory are
+reported for each benchmark in the terminal summary. Peak memory is
+measured by running the benchmark again under tracemalloc, so the other
+figures are not slowed down by it.
+"""
+
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+
+import pytest
+from click_odoo import odoo
+
+from click_odoo_contrib._addon_hash import HashCache, addon_hash
+from click_odoo_contrib.initdb import addons_hash
+from click_odoo_contrib.manifest import addon_index, expand_dependencies
+from click_odoo_contrib.update import DEFAULT_EXCLUDE_PATTERNS
+
+SCALE = float(os.environ.get("CLICK_ODOO_CONTRIB_BENCHMARK_SCALE", "0.1"))
+MODULES = max(int(300 * SCALE), 10)
+# each module depends on this many of the previous regular modules
+DEPENDS = 8
+# one module out of AUTO_INSTALL_EVERY is auto_install, and depends on
+# the next auto_install module too, the worst case for resolving them
+AUTO_INSTALL_EVERY = 10
+STATIC_DEPTH = 6
+LANGS = max(int(40 * SCALE), 2)
+PO_SIZE = 50 * 1024
+PY_FILES = 10
+PY_SIZE = 8 * 1024
+# addons of the auto_install closure benchmark, which only have a manifest
+GRAPH_MODULES = max(int(5000 * SCALE), 100)
+
+_opened = [0]
+_counting = [False]
+_audit_hook_installed = [False]
+
+
+def _audit(event, args):
+    if _counting[0] and event in ("open", "os.scandir", "os.listdir"):
+        _opened[0] += 1
+
+
+def _install_audit_hook():
+    """Install the audit hook counting opened files, and tell if it is."""
+    # audit hooks cannot be removed, so this one is only installed when a
+    # benchmark runs, and only counts while measuring
+    if not _audit_hook_installed[0] and hasattr(sys, "addaudithook"):
+        sys.addaudithook(_audit)
+        _audit_hook_installed[0] = True
+    return _audit_hook_installed[0]
+
+
+def _io_syscalls():
+    try:
+        with open("/proc/self/io") as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(io["syscr"]) + int(io["syscw"])
+
+
+def _measure(func, *args, setup=None, **kwargs):
+    """Return (result, stats) of a function call.
+
+    The function is called twice, after setup if given: once for wall
+    time, syscalls and opened files, and once for peak memory, as
+    tracemalloc slows python code down.
+    """
+    counting_opened = _install_audit_hook()
+    if setup:
+        setup()
+    syscalls = _io_syscalls()
+    _opened[0] = 0
+    _counting[0] = True
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        wall = time.perf_counter() - start
+    finally:
+        _counting[0] = False
+    if syscalls is not None:
+        syscalls = _io_syscalls() - syscalls
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    stats = {
+        "wall": wall,
+        "syscalls": syscalls,
+        "opened": _opened[0] if counting_opened else None,
+        "peak": peak,
+    }
+    return result, stats
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = b"# synthetic content for benchmarks\n"
+    with open(path, "wb") as f:
+        f.write(line * (size // len(line) + 1))
+
+
+def _module_name(i):
+    return "bench_{:04d}".format(i)
+
+
+def _is_auto_install(i):
+    return i % AUTO_INSTALL_EVERY == AUTO_INSTALL_EVERY - 1
+
+
+def _make_addons(root):
+    """Create a synthetic addons directory and return its module names."""
+    module_names = []
+    regular_names = []
+    for i in range(MODULES):
+        module_name = _module_name(i)
+        module_dir = os.path.join(root, module_name)
+        depends = regular_names[-DEPENDS:] or ["base"]
+        auto_install = _is_auto_install(i)
+        if auto_install:
+            if i + AUTO_INSTALL_EVERY < MODULES:
+                depends = depends + [_module_name(i + AUTO_INSTALL_EVERY)]
+        else:
+            regular_names.append(module_name)
+        manifest = {
+            "name": module_name,
+            "version": "1.0.0",
+            "depends": depends,
+            "auto_install": auto_install,
+            "installable": True,
+        }
+        _write(os.path.join(module_dir, "__init__.py"), 0)
+        with open(os.path.join(module_dir, "__manifest__.py"), "w") as f:
+            f.write(repr(manifest))
+        for j in range(PY_FILES):
+            _write(os.path.join(module_dir, "models", "m{}.py".format(j)), PY_SIZE)
+        static_dir = os.path.join(module_dir, "static")
+        for depth in range(STATIC_DEPTH):
+            static_dir = os.path.join(static_dir, "d{}".format(depth))
+            _write(os.path.join(static_dir, "file.js"), 4 * 1024)
+        for j in range(LANGS):
+            _write(os.path.join(module_dir, "i18n", "l{}.po".format(j)), PO_SIZE)
+        module_names.append(module_name)
+    return module_names
+
+
+@pytest.fixture(scope="module")
+def benchmark_addons(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp("benchmark_addons"))
+    module_names = _make_addons(root)
+    # make files old enough for their digests to be cached
+    mtime = time.time() - 3600
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            os.utime(os.path.join(dirpath, filename), (mtime, mtime))
+    return root, module_names
+
+
+@pytest.fixture
+def benchmark_addons_path(benchmark_addons, monkeypatch):
+    root, module_names = benchmark_addons
+    # let odoo find the synthetic addons first
+    monkeypatch.setattr(
+        odoo.addons, "__path__", [root] + list(odoo.addons.__path__), raising=False
+    )
+    if isinstance(getattr(odoo.modules.module, "ad_paths", None), list):
+        monkeypatch.setattr(
+            odoo.modules.module, "ad_paths", [root] + odoo.modules.module.ad_paths
+        )
+    # measure a cold addon index
+    addon_index.clear()
+    return root, module_names
+
+
+@pytest.fixture(scope="module")
+def benchmark_graph(tmp_path_factory):
+    """Create manifests of GRAPH_MODULES addons, half of them auto_install
+    in a chain where each one depends on the next, so they are released
+    in reverse order."""
+    root = str(tmp_path_factory.mktemp("benchmark_graph"))
+    half = GRAPH_MODULES // 2
+    for i in range(GRAPH_MODULES):
+        if i < half:
+            module_name = "graph_{:05d}".format(i)
+            depends = ["graph_{:05d}".format(i - 1)] if i else []
+            auto_install = False
+        else:
+            module_name = "graph_auto_{:05d}".format(i)
+            depends = ["graph_{:05d}".format(i - half)]
+            if i + 1 < GRAPH_MODULES:
+                depends.append("graph_auto_{:05d}".format(i + 1))
+            auto_install = True
+        module_dir = os.path.join(root, module_name)
+        os.makedirs(module_dir)
+        with open(os.path.join(module_dir, "__manifest__.py"), "w") as f:
+            f.write(repr({"depends": depends, "auto_install": auto_install}))
+    return root
+
+
+@pytest.fixture(scope="module")
+def report(summary_lines):
+    rows = []
+    yield rows
+    lines = [
+        "{:<40} {:>8} {:>10} {:>8} {:>9}".format(
+            "benchmark ({}/{} modules)".format(MODULES, GRAPH_MODULES),
+            "wall",
+            "syscalls",
+            "opened",
+            "peak",
+        ),
+    ]
+    for name, stats in rows:
+        lines.append(
+            "{:<40} {:>7.3f}s {:>10} {:>8} {:>6.1f}MiB".format(
+                name,
+                stats["wall"],
+                "n/a" if stats["syscalls"] is None else stats["syscalls"],
+                "n/a" if stats["opened"] is None else stats["opened"],
+                stats["peak"] / 2**20,
+            )
+        )
+    summary_lines.extend(lines)
+
+
+def _hash_all(root, module_names, cache_dir=None):
+    # with a new cache each time, so measures do not share it in memory
+    cache = HashCache(cache_dir) if cache_dir else None
+    digests = {
+        module_name: addon_hash(
+            os.path.join(root, module_name),
+            DEFAULT_EXCLUDE_PATTERNS.split(","),
+            ["en_US"],
+            cache=cache,
+        )
+        for module_name in module_names
+    }
+    if cache:
+        cache.save()
+    return digests
+
+
+def test_benchmark_addon_hash(benchmark_addons, report, tmp_path):
+    root, module_names = benchmark_addons
+    digests, stats = _measure(_hash_all, root, module_names)
+    report.append(("addon_hash", stats))
+    assert len(digests) == MODULES
+    cache_dir = str(tmp_path / "cache")
+    _, stats = _measure(
+        _hash_all,
+        root,
+        module_names,
+        cache_dir,
+        setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True),
+    )
+    report.append(("addon_hash, cold cache", stats))
+    cached_digests, stats = _measure(_hash_all, root, module_names, cache_dir)
+    report.append(("addon_hash, warm cache", stats))
+    assert cached_digests == digests
+
+
+def test_benchmark_initdb_addons_hash(benchmark_addons_path, report):
+    _, module_names = benchmark_addons_path
+    hashsum, stats = _measure(addons_hash, module_names, True)
+    report.append(("initdb.addons_hash", stats))
+    assert hashsum
+
+
+def test_benchmark_expand_dependencies(benchmark_addons_path, report):
+    _, module_names = benchmark_addons_path
+    regular_names = [
+        module_name
+        for i, module_name in enumerate(module_names)
+        if not _is_auto_install(i)
+    ]
+    res, stats = _measure(
+        expand_dependencies, regular_names[-1:], setup=addon_index.clear
+    )
+    report.append(("expand_dependencies", stats))
+    assert set(regular_names) <= res
+    assert not set(module_names) - set(regular_names) & res
+    res, stats = _measure(
+        expand_dependencies,
+        regular_names[-1:],
+        include_auto_install=True,
+        include_active=True,
+    )
+    report.append(("expand_dependencies, auto_install", stats))
+    assert set(module_names) <= res
+
+
+def test_benchmark_expand_dependencies_graph(benchmark_graph, report):
+    addon_index.clear()
+    addons_path = [benchmark_graph]
+    # read manifests first, to only measure the closure
+    expand_dependencies([], include_auto_install=True, addons_path=addons_path)
+    last_module = "graph_{:05d}".format(GRAPH_MODULES // 2 - 1)
+    res, stats = _measure(
+        expand_dependencies,
+        [last_module],
+        include_auto_install=True,
+        addons_path=addons_path,
+    )
+    report.append(("expand_dependencies, auto_install chain", stats))
+    assert len(res) == GRAPH_MODULES
@@ -0,0 +1,102 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from click_odoo import OdooEnvironment
+
+from click_odoo_contrib._addon_hash import addon_hash
+from click_odoo_contrib._snapshot import ChecksumsSnapshot, watcher_lock
+from click_odoo_contrib.update import (
+    DEFAULT_EXCLUDE_PATTERNS,
+    _load_installed_checksums,
+)
+
+# this extends the addons path of the odoodb and odoocfg fixtures
+test_addons_dir = os.path.join(os.path.dirname(__file__), "data", "test_update", "v3")
+
+
+def _checksums(odoocfg, output, *args):
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.checksums",
+        "-c",
+        str(odoocfg),
+        "-o",
+        output,
+    ]
+    subprocess.check_call(cmd + list(args))
+    with open(output) as f:
+        return json.load(f)
+
+
+def _only_compute_hashes(odoodb, odoocfg, snapshot):
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "-c",
+        str(odoocfg),
+        "-d",
+        odoodb,
+        "--only-compute-hashes",
+        "--checksums-snapshot",
+        snapshot,
+    ]
+    subprocess.check_call(cmd)
+    with OdooEnvironment(odoodb) as env:
+        return _load_installed_checksums(env.cr)
+
+
+def test_checksums(odoodb, odoocfg, tmpdir):
+    snapshot_path = str(tmpdir / "checksums.json")
+    snapshot = _checksums(odoocfg, snapshot_path)
+    addon_app = snapshot["modules"]["addon_app"]
+    assert addon_app["checksum"] == addon_hash(
+        os.path.join(test_addons_dir, "addon_app"),
+        DEFAULT_EXCLUDE_PATTERNS.split(","),
+        ["en_US"],
+    )
+    assert addon_app["tree"]
+    assert "base" in snapshot["modules"]
+    checksums = _only_compute_hashes(odoodb, odoocfg, snapshot_path)
+    assert checksums["addon_app"] == addon_app["checksum"]
+    # checksums of the snapshot are used without reading addons
+    addon_app["checksum"] = "0" * 40
+    with open(snapshot_path, "w") as f:
+        json.dump(snapshot, f)
+    checksums = _only_compute_hashes(odoodb, odoocfg, snapshot_path)
+    assert checksums["addon_app"] == "0" * 40
+
+
+def test_checksums_mismatch(odoodb, odoocfg, tmpdir):
+    snapshot_path = str(tmpdir / "checksums.json")
+    snapshot = _checksums(odoocfg, snapshot_path, "--languages", "en_US,fr_FR")
+    expected_checksum = snapshot["modules"]["addon_app"]["checksum"]
+    snapshot["modules"]["addon_app"]["checksum"] = "0" * 40
+    with open(snapshot_path, "w") as f:
+        json.dump(snapshot, f)
+    # the database has other active languages, so the snapshot is ignored
+    checksums = _only_compute_hashes(odoodb, odoocfg, snapshot_path)
+    assert checksums["addon_app"] != "0" * 40
+    # addon_app has no fr translation, so its checksum is the same
+    assert checksums["addon_app"] == expected_checksum
+
+
+def test_checksums_snapshot_watcher(tmpdir):
+    params = (["/addons"], ["*.pyc"], ["en_US"], "content", "sha1")
+    snapshot_path = str(tmpdir / "checksums.json")
+    ChecksumsSnapshot.create(*params, {}, {}, watched=True).save(snapshot_path)
+    assert not ChecksumsSnapshot.load(snapshot_path).is_valid(*params)
+    with watcher_lock(snapshot_path):
+        assert ChecksumsSnapshot.load(snapshot_path).is_valid(*params)
+        with pytest.raises(OSError):
+            with watcher_lock(snapshot_path):
+                pass
+    # the lock is released when the watcher stops
+    assert not ChecksumsSnapshot.load(snapshot_path).is_valid(*params)
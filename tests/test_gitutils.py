@@ -6,7 +6,7 @@ import subprocess
 
 import pytest
 
-from click_odoo_contrib.gitutils import commit_if_needed
+from click_odoo_contrib.gitutils import commit_if_needed, git_tree_ids
 
 
 @pytest.fixture
@@ -86,3 +86,38 @@ def test_commit_reldir(gitdir):
         with open(file1, "w"):
             pass
         assert commit_if_needed([file1], "msg", cwd="subdir")
+
+
+def test_git_tree_ids(gitdir):
+    addons_dir = gitdir / "addons"
+    for addon in ("addon1", "addon2", "addon3"):
+        (addons_dir / addon / "__manifest__.py").ensure(file=True)
+    _git_add(["addons/addon1", "addons/addon2"], gitdir)
+    subprocess.check_call(["git", "commit", "-m", "msg"], cwd=str(gitdir))
+    addon1, addon2, addon3 = (
+        str(addons_dir / addon) for addon in ("addon1", "addon2", "addon3")
+    )
+    tree_ids = git_tree_ids([addon1, addon2, addon3])
+    # addon3 is not tracked
+    assert set(tree_ids) == {addon1, addon2}
+    assert (
+        tree_ids[addon1]
+        == subprocess.check_output(
+            ["git", "rev-parse", "HEAD:addons/addon1"],
+            cwd=str(gitdir),
+            universal_newlines=True,
+        ).strip()
+    )
+    # same content, same tree
+    assert tree_ids[addon1] == tree_ids[addon2]
+    # uncommitted change
+    (addons_dir / "addon1" / "__manifest__.py").write("{}")
+    # untracked file
+    (addons_dir / "addon2" / "models.py").ensure(file=True)
+    assert git_tree_ids([addon1, addon2, addon3]) == {}
+
+
+def test_git_tree_ids_not_git(tmpdir):
+    addon1 = tmpdir / "addon1"
+    addon1.ensure(dir=True)
+    assert git_tree_ids([str(addon1)]) == {}
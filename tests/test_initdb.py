@@ -13,8 +13,9 @@ import pytest
 from click.testing import CliRunner
 
 from click_odoo_contrib import initdb
+from click_odoo_contrib._addon_hash import HashCache
 from click_odoo_contrib._dbutils import pg_connect
-from click_odoo_contrib.initdb import DbCache, main
+from click_odoo_contrib.initdb import DbCache, addons_hash, main
 
 TEST_DBNAME = "click-odoo-contrib-testinitdb"
 TEST_DBNAME_NEW = "click-odoo-contrib-testinitdb-new"
@@ -294,6 +295,19 @@ def test_create_cmd_cache(dbcache, tmpdir):
             _dropdb(TEST_DBNAME_NEW)
 
 
+def test_addons_hash(tmpdir):
+    hashsum = addons_hash(["auth_signup"], True)
+    assert len(hashsum) == DbCache.HASH_SIZE
+    assert addons_hash(["auth_signup"], False) != hashsum
+    assert addons_hash(["auth_signup"], True, checksum_algorithm="blake2b") != hashsum
+    # per-module digests are cached, and give the same hashsum
+    hash_cache = HashCache(str(tmpdir))
+    assert addons_hash(["auth_signup"], True, hash_cache=hash_cache) == hashsum
+    hash_cache.save()
+    hash_cache = HashCache(str(tmpdir))
+    assert addons_hash(["auth_signup"], True, hash_cache=hash_cache) == hashsum
+
+
 def test_create_cmd_nocache(dbcache):
     assert dbcache.size == 0
     try:
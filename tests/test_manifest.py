@@ -1,7 +1,11 @@
 # Copyright 2018 ACSONE SA/NV (<http://acsone.eu>)
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
+import json
 import os
+import random
+import shutil
+import time
 
 import pytest
 from click_odoo import odoo
@@ -25,6 +29,28 @@ def test_manifest_find_addons_uninstallable():
     assert addons[1][0] == "addon_uninstallable"
 
 
+def test_manifest_find_addons_changed(tmp_path):
+    addons_dir = tmp_path / "addons"
+    addons_dir.mkdir()
+    addon_a = _make_addon(addons_dir, "addon_a", {})
+    addon_b = _make_addon(addons_dir, "addon_b", {})
+    addons = list(manifest.find_addons(str(addons_dir)))
+    assert [addon[0] for addon in addons] == ["addon_a", "addon_b"]
+    # added, removed and modified addons are seen by the next call
+    shutil.rmtree(addon_a)
+    _make_addon(addons_dir, "addon_c", {})
+    with open(os.path.join(addon_b, "__manifest__.py"), "w") as f:
+        f.write(repr({"depends": ["mail"]}))
+    addons = list(manifest.find_addons(str(addons_dir)))
+    assert [addon[0] for addon in addons] == ["addon_b", "addon_c"]
+    assert addons[0][2] == {"depends": ["mail"]}
+
+
+def test_manifest_find_addons_missing_dir(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(manifest.find_addons(str(tmp_path / "missing")))
+
+
 def test_manifest_expand_dependencies():
     res = manifest.expand_dependencies(["auth_signup", "base_import"])
     assert "auth_signup" in res
@@ -53,3 +79,289 @@ def test_manifest_expand_dependencies_auto_install():
 def test_manifest_expand_dependencies_not_found():
     with pytest.raises(manifest.ModuleNotFound):
         manifest.expand_dependencies(["not_a_module"])
+
+
+def _make_addon(addons_dir, addon_name, manifest_dict):
+    addon_dir = addons_dir / addon_name
+    addon_dir.mkdir()
+    (addon_dir / "__manifest__.py").write_text(repr(manifest_dict))
+    return str(addon_dir)
+
+
+def test_addon_index(tmp_path):
+    addons_dir1 = tmp_path / "addons1"
+    addons_dir1.mkdir()
+    addons_dir2 = tmp_path / "addons2"
+    addons_dir2.mkdir()
+    addon_a = _make_addon(addons_dir1, "addon_a", {"depends": ["addon_b"]})
+    _make_addon(addons_dir2, "addon_a", {})
+    addon_b = _make_addon(addons_dir2, "addon_b", {})
+    (addons_dir2 / "not_an_addon").mkdir()
+    (addons_dir2 / "README").write_text("")
+    addons_path = [str(addons_dir1), str(addons_dir2), str(tmp_path / "missing")]
+    index = manifest.AddonIndex()
+    assert index.addon_names(addons_path) == ["addon_a", "addon_b"]
+    # the first addon found in the addons path wins, like in Odoo
+    assert index.addon_dir("addon_a", addons_path) == addon_a
+    assert index.addon_dir("addon_b", addons_path) == addon_b
+    assert index.addon_dir("not_an_addon", addons_path) is None
+    assert index.depends(addon_a) == ["addon_b"]
+    assert index.depends(addon_b) == ["base"]
+    # directories are listed once until the index is cleared
+    _make_addon(addons_dir1, "addon_c", {})
+    assert index.addon_dir("addon_c", addons_path) is None
+    index.clear()
+    assert index.addon_dir("addon_c", addons_path)
+
+
+def test_addon_index_cache(tmp_path, monkeypatch):
+    addons_dir = tmp_path / "addons"
+    addons_dir.mkdir()
+    addon_a = _make_addon(addons_dir, "addon_a", {"depends": ["mail"]})
+    addon_b = _make_addon(addons_dir, "addon_b", {})
+    # make manifests old enough to be cached
+    mtime = time.time() - 3600
+    for addon_dir in (addon_a, addon_b):
+        os.utime(os.path.join(addon_dir, "__manifest__.py"), (mtime, mtime))
+    cache_dir = str(tmp_path / "cache")
+    addons_path = [str(addons_dir)]
+    index = manifest.AddonIndex(cache_dir)
+    assert index.depends(index.addon_dir("addon_a", addons_path)) == ["mail"]
+    index.save()
+    # cached manifests are not parsed again
+    monkeypatch.setattr(manifest, "parse_manifest", None)
+    index = manifest.AddonIndex(cache_dir)
+    assert index.depends(index.addon_dir("addon_a", addons_path)) == ["mail"]
+    monkeypatch.undo()
+    # a modified manifest is parsed again
+    with open(os.path.join(addon_a, "__manifest__.py"), "w") as f:
+        f.write(repr({"depends": ["sale"]}))
+    index = manifest.AddonIndex(cache_dir)
+    assert index.depends(index.addon_dir("addon_a", addons_path)) == ["sale"]
+    # a renamed addon is found under its new name only
+    os.rename(addon_b, str(addons_dir / "addon_c"))
+    index = manifest.AddonIndex(cache_dir)
+    assert index.addon_names(addons_path) == ["addon_a", "addon_c"]
+    assert index.manifest(index.addon_dir("addon_c", addons_path)) == {}
+    index.save()
+    cache_files = os.listdir(cache_dir)
+    assert len(cache_files) == 1
+    with open(os.path.join(cache_dir, cache_files[0])) as f:
+        assert sorted(json.load(f)["addons"]) == ["addon_a", "addon_c"]
+
+
+def test_addon_index_cache_types(tmp_path):
+    addons_dir = tmp_path / "addons"
+    addons_dir.mkdir()
+    manifests = {
+        "addon_a": {"depends": ["mail"], "data": ["views.xml"]},
+        # json would turn tuples into lists and keys into strings
+        "addon_b": {"depends": ("mail",)},
+        "addon_c": {"depends": ["mail"], "demo": {1: "demo.xml"}},
+    }
+    mtime = time.time() - 3600
+    for addon_name, manifest_dict in manifests.items():
+        addon_dir = _make_addon(addons_dir, addon_name, manifest_dict)
+        os.utime(os.path.join(addon_dir, "__manifest__.py"), (mtime, mtime))
+    cache_dir = str(tmp_path / "cache")
+    addons_path = [str(addons_dir)]
+    index = manifest.AddonIndex(cache_dir)
+    for addon_name in manifests:
+        index.manifest(index.addon_dir(addon_name, addons_path))
+    index.save()
+    with open(os.path.join(cache_dir, os.listdir(cache_dir)[0])) as f:
+        assert sorted(json.load(f)["addons"]) == ["addon_a"]
+    # cached manifests are the ones parsed from manifest files
+    index = manifest.AddonIndex(cache_dir)
+    for addon_name, manifest_dict in manifests.items():
+        addon_dir = index.addon_dir(addon_name, addons_path)
+        assert index.manifest(addon_dir) == manifest.read_manifest(addon_dir)
+        assert index.manifest(addon_dir) == manifest_dict
+
+
+def _expand_dependencies_retry(module_names, manifests):
+    """The previous, quadratic, auto_install closure, for reference."""
+
+    def add_deps(name):
+        if name in res:
+            return
+        res.add(name)
+        for dep in manifests[name].get("depends", ["base"]):
+            add_deps(dep)
+
+    res = set()
+    for module_name in module_names:
+        add_deps(module_name)
+    retry = True
+    while retry:
+        retry = False
+        for module_name, manifest_dict in sorted(manifests.items()):
+            if module_name in res or not manifest_dict.get("auto_install"):
+                continue
+            if set(manifest_dict.get("depends", ["base"])).issubset(res):
+                add_deps(module_name)
+                retry = True
+    return res
+
+
+def _make_oca_like_manifests(seed, repos=12, addons_per_repo=25):
+    """Return random manifests shaped like OCA repositories: addons depend
+    on addons of their repository and of a few previous ones, and
+    auto_install glue addons bridge two addons, sometimes other glue ones."""
+    rnd = random.Random(seed)
+    manifests = {"base": {"depends": []}}
+    names = ["base"]
+    glue_names = []
+    for repo in range(repos):
+        for i in range(addons_per_repo):
+            name = "repo{}_addon{}".format(repo, i)
+            depends = rnd.sample(names, min(len(names), rnd.randint(1, 4)))
+            manifests[name] = {"depends": depends}
+            names.append(name)
+            if rnd.random() < 0.2:
+                glue_name = name + "_glue"
+                glue_depends = [name, rnd.choice(names)]
+                if glue_names and rnd.random() < 0.3:
+                    glue_depends.append(rnd.choice(glue_names))
+                manifests[glue_name] = {
+                    "depends": glue_depends,
+                    "auto_install": True,
+                }
+                glue_names.append(glue_name)
+    return manifests
+
+
+def test_expand_dependencies_auto_install_retry(tmp_path):
+    for seed in range(5):
+        manifests = _make_oca_like_manifests(seed)
+        addons_dir = tmp_path / str(seed)
+        addons_dir.mkdir()
+        for name, manifest_dict in manifests.items():
+            _make_addon(addons_dir, name, manifest_dict)
+        rnd = random.Random(seed)
+        regular_names = [n for n, m in manifests.items() if not m.get("auto_install")]
+        for _ in range(10):
+            module_names = rnd.sample(regular_names, rnd.randint(1, 10))
+            res = manifest.expand_dependencies(
+                module_names, include_auto_install=True, addons_path=[str(addons_dir)]
+            )
+            assert res == _expand_dependencies_retry(module_names, manifests)
+
+
+def test_manifest_expand_dependencies_auto_install_retry():
+    addons_path = manifest._get_addons_path()
+    manifests = {
+        module_name: manifest.addon_index.manifest(
+            manifest.addon_index.addon_dir(module_name, addons_path)
+        )
+        for module_name in manifest.addon_index.addon_names(addons_path)
+    }
+    for module_names in (["base"], ["auth_signup"], ["sale", "stock"]):
+        if not set(module_names) <= set(manifests):
+            continue
+        res = manifest.expand_dependencies(module_names, include_auto_install=True)
+        assert res == _expand_dependencies_retry(module_names, manifests)
+
+
+def test_dependency_graph():
+    graph = manifest.DependencyGraph(
+        {
+            "base": [],
+            "web": ["base"],
+            "mail": ["base", "web"],
+            "sale": ["mail", "not_found"],
+            "stock": ["mail"],
+            "sale_stock": ["sale", "stock"],
+        }
+    )
+    assert len(graph) == 6
+    assert graph.missing == {"sale": ["not_found"]}
+    assert graph.depends("sale") == ["mail"]
+    assert graph.dependents("mail") == ["sale", "stock"]
+    assert graph.dependencies(["sale"]) == {"sale", "mail", "web", "base"}
+    assert graph.reverse_dependencies(["stock"]) == {"stock", "sale_stock"}
+    assert graph.reverse_dependencies(["web"]) == set(graph.names) - {"base"}
+    assert graph.levels() == {
+        "base": 0,
+        "web": 1,
+        "mail": 2,
+        "sale": 3,
+        "stock": 3,
+        "sale_stock": 4,
+    }
+    assert graph.topological_order(["sale_stock", "web", "stock", "sale"]) == [
+        "web",
+        "sale",
+        "stock",
+        "sale_stock",
+    ]
+    assert graph.cycles() == []
+    assert graph.is_subset(["sale"], ["sale_stock"])
+    assert not graph.is_subset(["sale"], ["stock"])
+    assert graph.is_superset(["sale", "stock"], ["mail"])
+    assert not graph.is_superset(["mail"], ["sale"])
+    with pytest.raises(manifest.ModuleNotFound):
+        graph.dependencies(["not_found"])
+
+
+def test_dependency_graph_cycles():
+    graph = manifest.DependencyGraph(
+        {
+            "base": [],
+            "a": ["base", "b"],
+            "b": ["c"],
+            "c": ["a"],
+            "d": ["d"],
+            "e": ["a"],
+        }
+    )
+    assert graph.cycles() == [["a", "b", "c"], ["d"]]
+    assert graph.dependencies(["e"]) == {"a", "b", "c", "e", "base"}
+    with pytest.raises(manifest.DependencyCycle) as e:
+        graph.levels()
+    assert e.value.cycles == [["a", "b", "c"], ["d"]]
+
+
+def test_dependency_graph_oca_like():
+    manifests = _make_oca_like_manifests(0)
+    graph = manifest.DependencyGraph(
+        {name: manifest_dict["depends"] for name, manifest_dict in manifests.items()}
+    )
+    levels = graph.levels()
+    rnd = random.Random(0)
+    for name in graph.names:
+        for dep in graph.depends(name):
+            assert levels[dep] < levels[name]
+            assert name in graph.reverse_dependencies([dep])
+        other_name = rnd.choice(graph.names)
+        deps = graph.dependencies([name])
+        other_deps = graph.dependencies([other_name])
+        assert graph.is_subset([name], [other_name]) == (deps <= other_deps)
+        assert graph.is_superset([name], [other_name]) == (deps >= other_deps)
+
+
+def test_manifest_find_addons_parallel(tmp_path):
+    addons_dir = tmp_path / "addons"
+    addons_dir.mkdir()
+    for i in range(manifest.PARALLEL_MIN_ITEMS * 2):
+        _make_addon(addons_dir, "addon_{:02d}".format(i), {"installable": i % 3 > 0})
+    (addons_dir / "not_an_addon").mkdir()
+    addons = list(manifest.find_addons(str(addons_dir)))
+    assert [addon[0] for addon in addons] == [
+        "addon_{:02d}".format(i)
+        for i in range(manifest.PARALLEL_MIN_ITEMS * 2)
+        if i % 3 > 0
+    ]
+    sequential_index = manifest.AddonIndex(jobs=1)
+    for addon_name, addon_dir, manifest_dict in addons:
+        assert sequential_index.addon_dir(addon_name, [str(addons_dir)]) == addon_dir
+        assert sequential_index.manifest(addon_dir) == manifest_dict
+    # errors are raised in name order
+    broken_dir = addons_dir / "addon_99"
+    broken_dir.mkdir()
+    (broken_dir / "__manifest__.py").write_text("{")
+    addons = manifest.find_addons(str(addons_dir), installable_only=False)
+    for i in range(manifest.PARALLEL_MIN_ITEMS * 2):
+        assert next(addons)[0] == "addon_{:02d}".format(i)
+    with pytest.raises(SyntaxError):
+        next(addons)
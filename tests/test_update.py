@@ -1,8 +1,12 @@
 # Copyright 2018 ACSONE SA/NV (<http://acsone.eu>)
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
+import functools
+import io
 import json
+import multiprocessing
 import os
+import shutil
 import subprocess
 import sys
 
@@ -10,8 +14,11 @@ import pytest
 from click.testing import CliRunner
 from click_odoo import OdooEnvironment, odoo, odoo_bin
 
+from click_odoo_contrib import _addon_hash, _bytecode, _planner
+from click_odoo_contrib._addon_hash import HashCache
 from click_odoo_contrib.update import (
     _load_installed_checksums,
+    _update_db,
     main,
 )
 
@@ -176,3 +183,213 @@ def test_parallel_watcher(odoodb):
     ]
     subprocess.check_call(cmd)
     # TODO Test an actual lock
+
+
+def test_update_hash_before_lock(odoodb, monkeypatch):
+    hashed_files = []
+    hash_file = _addon_hash.hash_file
+
+    def _hash_file(path, *hash_objects):
+        hashed_files.append(path)
+        return hash_file(path, *hash_objects)
+
+    monkeypatch.setattr(_addon_hash, "hash_file", _hash_file)
+    _update_db(odoodb, False, False, list_only=True, hash_cache=HashCache())
+    assert hashed_files
+    # addons are hashed before taking the lock, and only their file
+    # stats are checked under the lock
+    assert len(hashed_files) == len(set(hashed_files))
+    # so are they when planning the update
+    hashed_files.clear()
+    _update_db(odoodb, False, False, hash_cache=HashCache(), plan=io.StringIO())
+    assert hashed_files
+    assert len(hashed_files) == len(set(hashed_files))
+    # nothing is hashed when planning the update of all modules
+    hashed_files.clear()
+    _update_db(odoodb, True, False, hash_cache=HashCache(), plan=io.StringIO())
+    assert not hashed_files
+
+
+def test_update_databases(odoodb, tmpdir):
+    _install_one(odoodb, "v1")
+    log_dir = str(tmpdir / "logs")
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "--addons-path",
+        _addons_path("v2"),
+        "--databases",
+        odoodb + ",not-a-database-*",
+        "--databases-jobs",
+        "2",
+        "--databases-log-dir",
+        log_dir,
+    ]
+    subprocess.check_call(cmd)
+    _check_expected(odoodb, "v2")
+    assert os.listdir(log_dir) == [odoodb + ".log"]
+    # nothing changed, so the database is not updated again
+    output = subprocess.check_output(
+        cmd, stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    assert "no module needs updating" in output
+
+
+def test_update_timings_report(odoodb, tmpdir):
+    _install_one(odoodb, "v1")
+    timings_report = str(tmpdir / "timings.json")
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "--addons-path",
+        _addons_path("v2"),
+        "-d",
+        odoodb,
+        "--timings-report",
+        timings_report,
+    ]
+    subprocess.check_call(cmd)
+    _check_expected(odoodb, "v2")
+    with open(timings_report) as f:
+        report = json.load(f)
+    assert report["command"] == "update"
+    assert report["database"] == odoodb
+    assert report["total_seconds"] >= report["modules_seconds"] > 0
+    modules = {stats["module"]: stats for stats in report["modules"]}
+    assert modules["addon_app"]["action"] == "upgrade"
+    assert modules["base"]["action"] == "load"
+    assert modules["addon_app"]["sql_queries"] > 0
+
+
+def test_precompile_addons(tmp_path, monkeypatch):
+    addon_dir = tmp_path / "addon_a"
+    (addon_dir / "models").mkdir(parents=True)
+    (addon_dir / "tests").mkdir()
+    (addon_dir / "__init__.py").write_text("from . import models\n")
+    (addon_dir / "models" / "__init__.py").write_text("A = 1\n")
+    (addon_dir / "tests" / "test_a.py").write_text("B = 2\n")
+    (addon_dir / "broken.py").write_text("def\n")
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    files_count, compile_seconds, _ = _bytecode.precompile_addons(
+        [str(addon_dir)], jobs=1
+    )
+    assert files_count == 2
+    assert compile_seconds > 0
+    assert (addon_dir / "__pycache__").is_dir()
+    assert not (addon_dir / "tests" / "__pycache__").exists()
+    # up to date bytecode is not compiled again
+    files_count, compile_seconds, _ = _bytecode.precompile_addons(
+        [str(addon_dir)], jobs=1
+    )
+    assert files_count == 0
+    assert compile_seconds == 0
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="needs sys.pycache_prefix")
+def test_precompile_addons_read_only(tmp_path, monkeypatch):
+    addon_dir = tmp_path / "addon_a"
+    addon_dir.mkdir()
+    (addon_dir / "__init__.py").write_text("A = 1\n")
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("CLICK_ODOO_CONTRIB_CACHE_DIR", str(cache_dir))
+    monkeypatch.setattr(sys, "pycache_prefix", None)
+    monkeypatch.setattr(_bytecode, "_is_writable", lambda addon_dir: False)
+    files_count, _, _ = _bytecode.precompile_addons([str(addon_dir)], jobs=1)
+    assert files_count == 1
+    assert sys.pycache_prefix == str(cache_dir / "pycache")
+    assert not (addon_dir / "__pycache__").exists()
+    assert list((cache_dir / "pycache").glob("**/__init__*.pyc"))
+    # compiling processes write bytecode there too, however they are started
+    for i in range(_bytecode.CHUNK_SIZE * 2):
+        (addon_dir / "module_{}.py".format(i)).write_text("A = 1\n")
+    for start_method in ("spawn", "fork"):
+        monkeypatch.setattr(
+            _bytecode,
+            "ProcessPoolExecutor",
+            functools.partial(
+                _bytecode.ProcessPoolExecutor,
+                mp_context=multiprocessing.get_context(start_method),
+            ),
+        )
+        shutil.rmtree(str(cache_dir / "pycache"))
+        files_count, _, _ = _bytecode.precompile_addons([str(addon_dir)], jobs=2)
+        assert files_count == _bytecode.CHUNK_SIZE * 2 + 1
+        assert not (addon_dir / "__pycache__").exists()
+
+
+def test_update_precompile(odoodb):
+    _install_one(odoodb, "v1")
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "--addons-path",
+        _addons_path("v2"),
+        "-d",
+        odoodb,
+        "--precompile",
+    ]
+    output = subprocess.check_output(
+        cmd, stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    _check_expected(odoodb, "v2")
+    assert "Precompiled" in output
+    assert "precompilation saved about" in output
+
+
+def test_update_plan(odoodb):
+    _install_one(odoodb, "v1")
+    with OdooEnvironment(odoodb) as env:
+        env.cr.execute("DROP TABLE IF EXISTS " + _planner.DURATION_TABLE)
+    # durations are only stored on demand
+    _update_one(odoodb, "v1")
+    with OdooEnvironment(odoodb) as env:
+        assert not _planner.load_module_durations(env.cr)
+    subprocess.check_call(
+        [
+            sys.executable,
+            "-m",
+            "click_odoo_contrib.update",
+            "--addons-path",
+            _addons_path("v2"),
+            "-d",
+            odoodb,
+            "--record-durations",
+        ]
+    )
+    with OdooEnvironment(odoodb) as env:
+        durations = _planner.load_module_durations(env.cr)
+    assert ("addon_app", "upgrade") in durations
+    assert ("base", "load") in durations
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "--addons-path",
+        _addons_path("v3"),
+        "-d",
+        odoodb,
+        "--plan",
+        "-",
+    ]
+    plan = json.loads(subprocess.check_output(cmd, universal_newlines=True))
+    # the plan does not update the database
+    _check_expected(odoodb, "v2")
+    assert plan["database"] == odoodb
+    assert plan["modules_to_update"] == ["addon_app"]
+    assert plan["modules_to_upgrade"] == ["addon_app"]
+    assert plan["critical_path"]["modules"] == ["addon_app"]
+    assert plan["critical_path"]["seconds"] == durations[("addon_app", "upgrade")]
+    assert plan["upgrade_seconds"] == durations[("addon_app", "upgrade")]
+    assert plan["estimated_seconds"] >= plan["upgrade_seconds"]
+    modules = {module["module"]: module for module in plan["modules"]}
+    assert modules["base"]["action"] == "load"
+    assert modules["base"]["history"]
+    # all modules depend on base, so they are upgraded with it
+    plan = json.loads(
+        subprocess.check_output(cmd + ["--update-all"], universal_newlines=True)
+    )
+    assert plan["modules_to_upgrade"][0] == "base"
+    assert plan["critical_path"]["modules"][0] == "base"
@@ -1,22 +1,36 @@
 # Copyright 2018 ACSONE SA/NV (<http://acsone.eu>)
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
 
+import base64
+import json
 import os
 import subprocess
 import sys
+import zlib
 
 from click_odoo import OdooEnvironment, odoo, odoo_bin
 
+from click_odoo_contrib import _addon_hash
 from click_odoo_contrib.update import (
+    CHECKSUM_TABLE,
+    ChecksumSession,
+    _delete_installed_checksums,
+    _get_param,
     _load_installed_checksums,
+    _load_installed_trees,
+    _save_checksums,
+    _set_params,
     PARAM_INSTALLED_CHECKSUMS,
+    PARAM_INSTALLED_TREES,
 )
 
 # this extends the addons path of the odoodb and odoocfg fixtures
 test_addons_dir = os.path.join(os.path.dirname(__file__), "data", "test_update", "v3")
 
 
-def _only_compute_hashes(odoodb, odoocfg, ignore_addons, ignore_core_addons):
+def _only_compute_hashes(
+    odoodb, odoocfg, ignore_addons, ignore_core_addons, hash_jobs=None
+):
     cmd = [
         sys.executable,
         "-m",
@@ -31,6 +45,8 @@ def _only_compute_hashes(odoodb, odoocfg, ignore_addons, ignore_core_addons):
         cmd += ["--ignore-addons", ignore_addons]
     if ignore_core_addons:
         cmd += ["--ignore-core-addons"]
+    if hash_jobs:
+        cmd += ["--hash-jobs", str(hash_jobs)]
     subprocess.check_call(cmd)
 
 
@@ -50,9 +66,7 @@ def test_only_compute_hashes(odoodb, odoocfg):
 
     conn = odoo.sql_db.db_connect(odoodb)
     with conn.cursor() as cr:
-        cr.execute(
-            "DELETE from ir_config_parameter where key=%s", (PARAM_INSTALLED_CHECKSUMS,)
-        )
+        _delete_installed_checksums(cr)
 
     with OdooEnvironment(odoodb) as env:
         checksums = _load_installed_checksums(env.cr)
@@ -86,3 +100,204 @@ def test_only_compute_hashes(odoodb, odoocfg):
         assert "addon_app" in checksums
         assert "addon_d1" in checksums
         assert "addon_d2" in checksums
+
+
+def test_only_compute_hashes_jobs(odoodb, odoocfg):
+    _only_compute_hashes(
+        odoodb, odoocfg, ignore_addons=None, ignore_core_addons=False, hash_jobs=1
+    )
+    with OdooEnvironment(odoodb) as env:
+        checksums_sequential = _load_installed_checksums(env.cr)
+    _only_compute_hashes(
+        odoodb, odoocfg, ignore_addons=None, ignore_core_addons=False, hash_jobs=8
+    )
+    with OdooEnvironment(odoodb) as env:
+        checksums_parallel = _load_installed_checksums(env.cr)
+    assert checksums_parallel == checksums_sequential
+
+
+def test_checksum_algorithm_migration(odoodb, odoocfg):
+    _only_compute_hashes(odoodb, odoocfg, ignore_addons=None, ignore_core_addons=False)
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "-c",
+        odoocfg,
+        "-d",
+        odoodb,
+        "--checksum-algorithm",
+        "blake2b",
+    ]
+    # checksums stored with sha1 do not trigger an update
+    output = subprocess.check_output(
+        cmd + ["--list-only"], stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    assert "Updating addons" not in output
+    subprocess.check_call(cmd)
+    with OdooEnvironment(odoodb) as env:
+        checksums = _load_installed_checksums(env.cr)
+        assert checksums["addon_app"].startswith("blake2b:")
+        assert all(c.startswith("blake2b:") for c in checksums.values() if c)
+
+
+def test_checksum_session(odoodb):
+    with OdooEnvironment(odoodb) as env:
+        _delete_installed_checksums(env.cr)
+        session = ChecksumSession(env.cr)
+        assert session.installed_checksums == {}
+        assert "base" in session.modules_to_update()
+        session.save()
+        assert "base" in session.installed_checksums
+        assert _load_installed_checksums(env.cr) == session.installed_checksums
+        assert not ChecksumSession(env.cr).modules_to_update()
+
+
+def test_checksum_session_save_previous(odoodb, monkeypatch):
+    with OdooEnvironment(odoodb) as env:
+        session = ChecksumSession(env.cr)
+        session.modules_to_update()
+        assert "base" in session.hashes
+        session.hashes["base"] = ("0" * 40, None)
+        del session.hashes["web"]
+        new_session = ChecksumSession(env.cr)
+        hashed_modules = []
+        hash_modules = new_session.hash_modules
+
+        def _hash_modules(module_names, *args):
+            hashed_modules.extend(module_names)
+            return hash_modules(module_names, *args)
+
+        monkeypatch.setattr(new_session, "hash_modules", _hash_modules)
+        new_session.save(previous_session=session)
+        # only modules unknown to the previous session are hashed
+        assert hashed_modules == ["web"]
+        checksums = _load_installed_checksums(env.cr)
+        assert checksums["base"] == "0" * 40
+        assert checksums["web"]
+
+
+def test_checksum_table_migration(odoodb):
+    with OdooEnvironment(odoodb) as env:
+        env.cr.execute("DROP TABLE IF EXISTS " + CHECKSUM_TABLE)
+        tree = ["0" * 40, {"__init__.py": "1" * 40}]
+        trees = zlib.compress(json.dumps({"addon_app": tree}).encode("utf-8"))
+        _set_params(
+            env.cr,
+            {
+                PARAM_INSTALLED_CHECKSUMS: json.dumps(
+                    {"addon_app": "0" * 40, "addon_d1": "blake2b:" + "2" * 64}
+                ),
+                PARAM_INSTALLED_TREES: base64.b64encode(trees).decode("ascii"),
+            },
+        )
+        # checksums are read from parameters until the table is created
+        assert _load_installed_checksums(env.cr, ["addon_app"]) == {
+            "addon_app": "0" * 40
+        }
+        _save_checksums(env.cr, {"addon_d2": ("3" * 40, None)})
+        assert _load_installed_checksums(env.cr) == {
+            "addon_app": "0" * 40,
+            "addon_d1": "blake2b:" + "2" * 64,
+            "addon_d2": "3" * 40,
+        }
+        # checksums are mirrored for module_auto_update and previous versions
+        assert json.loads(
+            _get_param(env.cr, PARAM_INSTALLED_CHECKSUMS)
+        ) == _load_installed_checksums(env.cr)
+        assert _get_param(env.cr, PARAM_INSTALLED_TREES) is None
+        assert _load_installed_trees(env.cr, ["addon_app", "addon_d1"]) == {
+            "addon_app": tree
+        }
+        env.cr.execute(
+            "SELECT module, algorithm, files_count FROM "
+            + CHECKSUM_TABLE
+            + " ORDER BY module"
+        )
+        assert env.cr.fetchall() == [
+            ("addon_app", "sha1", 1),
+            ("addon_d1", "blake2b", None),
+            ("addon_d2", "sha1", None),
+        ]
+        # only changed checksums are written
+        env.cr.execute("UPDATE " + CHECKSUM_TABLE + " SET computed_at='2000-01-01'")
+        _save_checksums(
+            env.cr, {"addon_app": ("0" * 40, tree), "addon_d1": (False, None)}
+        )
+        env.cr.execute(
+            "SELECT module FROM "
+            + CHECKSUM_TABLE
+            + " WHERE computed_at > '2000-01-01' ORDER BY module"
+        )
+        assert env.cr.fetchall() == [("addon_d1",)]
+        assert _load_installed_checksums(env.cr, ["addon_d1"]) == {"addon_d1": False}
+        # changes are merged in the mirror
+        assert json.loads(
+            _get_param(env.cr, PARAM_INSTALLED_CHECKSUMS)
+        ) == _load_installed_checksums(env.cr)
+        _save_checksums(env.cr, {"addon_app": ("0" * 40, tree)}, full=True)
+        assert list(_load_installed_checksums(env.cr)) == ["addon_app"]
+        assert json.loads(_get_param(env.cr, PARAM_INSTALLED_CHECKSUMS)) == {
+            "addon_app": "0" * 40
+        }
+        _delete_installed_checksums(env.cr, ["addon_app"])
+        assert _load_installed_checksums(env.cr) == {}
+        assert _get_param(env.cr, PARAM_INSTALLED_CHECKSUMS) == "{}"
+
+
+def test_set_params(odoodb):
+    with OdooEnvironment(odoodb) as env:
+        _set_params(env.cr, {"test.param1": "1", "test.param2": "2"})
+        _set_params(env.cr, {"test.param1": "3", "test.param3": "4"})
+        assert _get_param(env.cr, "test.param1") == "3"
+        assert _get_param(env.cr, "test.param2") == "2"
+        assert _get_param(env.cr, "test.param3") == "4"
+
+
+def test_checksum_mode_semantic(odoodb, odoocfg):
+    _only_compute_hashes(odoodb, odoocfg, ignore_addons=None, ignore_core_addons=False)
+    cmd = [
+        sys.executable,
+        "-m",
+        "click_odoo_contrib.update",
+        "-c",
+        odoocfg,
+        "-d",
+        odoodb,
+        "--checksum-mode",
+        "semantic",
+    ]
+    # content checksums do not trigger an update
+    output = subprocess.check_output(
+        cmd + ["--list-only"], stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    assert "Updating addons" not in output
+    subprocess.check_call(cmd)
+    with OdooEnvironment(odoodb) as env:
+        checksums = _load_installed_checksums(env.cr)
+        assert checksums["addon_app"].startswith("semantic-sha1:")
+
+
+def test_checksum_mode_git(odoodb, monkeypatch):
+    with OdooEnvironment(odoodb) as env:
+        ChecksumSession(env.cr).save()
+        # modules clean in git keep their content checksum until migrated
+        session = ChecksumSession(env.cr, checksum_mode="git")
+        assert not session.modules_to_update()
+        assert session.needs_migration()
+        ChecksumSession(env.cr, checksum_mode="git").save(previous_session=session)
+        checksums = _load_installed_checksums(env.cr)
+        assert checksums["addon_app"].startswith("git:")
+        # then they are not hashed by content anymore
+        hashed_files = []
+        hash_file = _addon_hash.hash_file
+
+        def _hash_file(path, *hash_objects):
+            hashed_files.append(path)
+            return hash_file(path, *hash_objects)
+
+        monkeypatch.setattr(_addon_hash, "hash_file", _hash_file)
+        session = ChecksumSession(env.cr, checksum_mode="git")
+        assert not session.modules_to_update()
+        assert not session.needs_migration()
+        assert not [path for path in hashed_files if path.startswith(test_addons_dir)]
@@ -0,0 +1,90 @@
+# Copyright 2026 ACSONE SA/NV (<http://acsone.eu>)
+# License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl.html).
+
+import os
+import shutil
+
+import pytest
+
+from click_odoo_contrib._watch import AddonsWatcher
+from click_odoo_contrib.update import DEFAULT_EXCLUDE_PATTERNS
+
+pytest.importorskip("inotify_simple")
+
+TIMEOUT = 1000
+
+
+def _write(path, content="content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+@pytest.fixture
+def watcher(tmpdir):
+    addons_dir = str(tmpdir)
+    _write(os.path.join(addons_dir, "addon1", "__init__.py"))
+    _write(os.path.join(addons_dir, "addon1", "static", "src", "some.js"))
+    _write(os.path.join(addons_dir, "addon2", "__init__.py"))
+    watcher = AddonsWatcher([addons_dir], DEFAULT_EXCLUDE_PATTERNS.split(","))
+    try:
+        yield addons_dir, watcher
+    finally:
+        watcher.close()
+
+
+def test_watch_modified(watcher):
+    addons_dir, watcher = watcher
+    assert watcher.read(timeout=0) == set()
+    _write(os.path.join(addons_dir, "addon1", "__init__.py"), "modified")
+    assert watcher.read(timeout=TIMEOUT) == {"addon1"}
+    _write(os.path.join(addons_dir, "addon2", "models", "stuff.py"))
+    assert watcher.read(timeout=TIMEOUT) == {"addon2"}
+    # the new models directory is watched too
+    _write(os.path.join(addons_dir, "addon2", "models", "stuff.py"), "modified")
+    assert watcher.read(timeout=TIMEOUT) == {"addon2"}
+
+
+def test_watch_excluded(watcher):
+    addons_dir, watcher = watcher
+    _write(os.path.join(addons_dir, "addon1", "static", "src", "some.js"), "new")
+    _write(os.path.join(addons_dir, "addon1", "__init__.pyc"))
+    assert watcher.read(timeout=TIMEOUT) == set()
+
+
+def test_watch_added_removed(watcher):
+    addons_dir, watcher = watcher
+    _write(os.path.join(addons_dir, "addon3", "__init__.py"))
+    assert watcher.read(timeout=TIMEOUT) == {"addon3"}
+    shutil.rmtree(os.path.join(addons_dir, "addon2"))
+    assert watcher.read(timeout=TIMEOUT) == {"addon2"}
+
+
+def test_watch_symlink(watcher, tmpdir_factory):
+    addons_dir, watcher = watcher
+    target_dir = str(tmpdir_factory.mktemp("target"))
+    _write(os.path.join(target_dir, "addon4", "__init__.py"))
+    os.symlink(os.path.join(target_dir, "addon4"), os.path.join(addons_dir, "addon4"))
+    assert watcher.read(timeout=TIMEOUT) == {"addon4"}
+    # the target of the new link is watched
+    _write(os.path.join(target_dir, "addon4", "__init__.py"), "modified")
+    assert watcher.read(timeout=TIMEOUT) == {"addon4"}
+    _write(os.path.join(target_dir, "addon4", "models", "stuff.py"))
+    assert watcher.read(timeout=TIMEOUT) == {"addon4"}
+    # links to a parent directory are not followed
+    os.symlink(addons_dir, os.path.join(addons_dir, "addon1", "loop"))
+    assert watcher.read(timeout=TIMEOUT) == {"addon1"}
+
+
+def test_watch_symlink_existing(tmpdir):
+    target_dir = str(tmpdir / "target")
+    addons_dir = str(tmpdir / "addons")
+    _write(os.path.join(target_dir, "addon1", "__init__.py"))
+    os.makedirs(addons_dir)
+    os.symlink(os.path.join(target_dir, "addon1"), os.path.join(addons_dir, "addon1"))
+    watcher = AddonsWatcher([addons_dir], DEFAULT_EXCLUDE_PATTERNS.split(","))
+    try:
+        _write(os.path.join(target_dir, "addon1", "__init__.py"), "modified")
+        assert watcher.read(timeout=TIMEOUT) == {"addon1"}
+    finally:
+        watcher.close()